@@ -4,6 +4,8 @@ from logging import getLogger, getLevelNamesMapping, INFO, StreamHandler, FileHa
 
 from FilmPy.clips import ChessClip, ColorClip, CompositeClip, Clip, ImageClip, TextClip
 from FilmPy.Sequence import Sequence
+from FilmPy.EncoderProfile import EncoderProfile
+from FilmPy.FrameExecutor import FrameExecutor
 from FilmPy.clips.GridClip import GridClip
 from FilmPy.constants import *
 
@@ -68,6 +70,18 @@ class Editor:
         """
         return CompositeClip(*args, **kwargs)
 
+    @classmethod
+    def encoder_profile(cls, *args, **kwargs) -> EncoderProfile:
+        """
+        Instantiate an EncoderProfile, the settings ffmpeg encodes video files with
+
+        :param args: Arguments to pass to EncoderProfile, e.g. the profile name ('draft', 'fast', 'default', 'archive')
+        :param kwargs: Keyword arguments to pass to EncoderProfile, e.g. crf, preset, tune, threads, gop or bitrate
+
+        :return EncoderProfile: Instantiated encoder profile
+        """
+        return EncoderProfile(*args, **kwargs)
+
     @classmethod
     def image_clip(cls, **kwargs) -> ImageClip:
         """
@@ -182,6 +196,21 @@ class Editor:
         """
         return Sequence(clips)
 
+    @classmethod
+    def configure_executor(cls,
+                           executor=None,
+                           workers:int=None,
+                           chunk_size:int=None):
+        """
+        Configure how per-frame effects (painting, pixelate, rotate, resize, etc.) are spread across cores.
+        EXECUTOR, EXECUTOR_WORKERS and EXECUTOR_CHUNK_SIZE in .filmpy.env take precedence over these values.
+
+        :param executor   : Kind of executor to use (see ExecutorType), defaults to threads
+        :param workers    : Number of workers to use, 0 uses every core
+        :param chunk_size : Number of frames handed to a worker at a time
+        """
+        FrameExecutor.configure(executor=executor, workers=workers, chunk_size=chunk_size)
+
     @classmethod
     def configure_logging(cls,
                           *args,
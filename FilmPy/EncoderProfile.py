@@ -0,0 +1,184 @@
+from FilmPy.constants import *
+from logging import getLogger
+
+
+class EncoderProfile:
+    """
+    Settings ffmpeg encodes video files with, i.e. the speed / size / quality trade-off of a render.
+    Start from a named profile (see ENCODER_PROFILES) and override any of its settings.
+    """
+    # Settings a profile may contain, in the order their ffmpeg options are written
+    _settings = ('codec', 'preset', 'tune', 'crf', 'bitrate', 'gop', 'threads')
+
+    def __init__(self,
+                 name:str=None,
+                 codec:str=None,
+                 preset:str=None,
+                 crf:int=None,
+                 tune:str=None,
+                 threads:int=None,
+                 gop:int=None,
+                 bitrate:str=None):
+        """
+        Instantiate an encoder profile, any setting not supplied is taken from the named profile
+
+        :param name: Name of the profile to start from (see ENCODER_PROFILES), defaults to DEFAULT_ENCODER_PROFILE
+        :param codec: Video codec, None uses the default codec for the file's extension (see VIDEO_CODECS)
+        :param preset: Encoder preset, e.g. 'ultrafast', 'veryfast', 'medium', 'slow'
+        :param crf: Constant rate factor, lower is higher quality (0-51 for libx264)
+        :param tune: Encoder tuning, e.g. 'film', 'animation', 'stillimage', 'fastdecode', 'zerolatency'
+        :param threads: Number of encoder threads, 0 lets the encoder decide
+        :param gop: Maximum number of frames between keyframes
+        :param bitrate: Target video bitrate, e.g. '4M' or 4000000
+        :raises ValueError: When an unknown profile name or an invalid setting is received
+        """
+        name = DEFAULT_ENCODER_PROFILE if name is None else name
+
+        # Ensure the profile exists
+        if name not in ENCODER_PROFILES:
+            raise ValueError(f"'{name}' is not a valid encoder profile, valid profiles are {list(ENCODER_PROFILES)}")
+
+        # Ensure the numeric settings are in range
+        if (crf is not None) and (crf < 0):
+            raise ValueError(f"crf ({crf}) must be at least 0.")
+        if (threads is not None) and (threads < 0):
+            raise ValueError(f"threads ({threads}) must be at least 0.")
+        if (gop is not None) and (gop < 1):
+            raise ValueError(f"gop ({gop}) must be at least 1.")
+
+        # Start from the named profile, then apply the settings we were given
+        self._profile = dict.fromkeys(self._settings)
+        self._profile.update(ENCODER_PROFILES[name])
+        overrides = {'codec': codec, 'preset': preset, 'crf': crf, 'tune': tune,
+                     'threads': threads, 'gop': gop, 'bitrate': bitrate}
+        self._profile.update({setting: value for setting, value in overrides.items() if value is not None})
+        self._profile['name'] = name
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EncoderProfile) and (self._profile == other._profile)
+
+    def __repr__(self) -> str:
+        settings = ', '.join(f'{setting}={self._profile[setting]!r}' for setting in self._settings
+                             if self._profile[setting] is not None)
+        return f"{type(self).__name__}({self.name!r}{', ' if settings else ''}{settings})"
+
+    @property
+    def bitrate(self):
+        """
+        Target video bitrate, None leaves it to the encoder
+        """
+        return self._profile['bitrate']
+
+    @property
+    def codec(self) -> str:
+        """
+        Video codec, None uses the default codec for the file's extension
+        """
+        return self._profile['codec']
+
+    @property
+    def crf(self) -> int:
+        """
+        Constant rate factor, None leaves it to the encoder
+        """
+        return self._profile['crf']
+
+    @property
+    def gop(self) -> int:
+        """
+        Maximum number of frames between keyframes, None leaves it to the encoder
+        """
+        return self._profile['gop']
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the profile these settings started from
+        """
+        return self._profile['name']
+
+    @property
+    def preset(self) -> str:
+        """
+        Encoder preset
+        """
+        return self._profile['preset']
+
+    @property
+    def threads(self) -> int:
+        """
+        Number of encoder threads, None leaves it to the encoder
+        """
+        return self._profile['threads']
+
+    @property
+    def tune(self) -> str:
+        """
+        Encoder tuning, None for no tuning
+        """
+        return self._profile['tune']
+
+    @classmethod
+    def from_value(cls, profile=None):
+        """
+        Get an encoder profile from any of the values accepted by the write methods
+
+        :param profile: EncoderProfile, name of a profile, dict of settings or None (DEFAULT_ENCODER_PROFILE)
+        :raises ValueError: When the profile is not valid
+        :return profile: EncoderProfile
+        """
+        if isinstance(profile, EncoderProfile):
+            return profile
+        if isinstance(profile, dict):
+            return cls(**profile)
+        if (profile is None) or isinstance(profile, str):
+            return cls(profile)
+
+        raise ValueError(f"'{profile}' is not a valid encoder profile.")
+
+    def image_options(self, codec:str=None) -> list:
+        """
+        ffmpeg output options for encoding a single image.
+        Only the codec and threads apply, the remaining settings are specific to video encoders
+
+        :param codec: Codec to use instead of the profile's codec, if neither is set ffmpeg chooses from the extension
+        :return options: List of ffmpeg options
+        """
+        codec = codec or self.codec
+
+        options = []
+        if codec:
+            options.extend(['-vcodec', codec])
+        if self.threads is not None:
+            options.extend(['-threads', str(self.threads)])
+
+        return options
+
+    def video_options(self, codec:str=None) -> list:
+        """
+        ffmpeg output options for encoding a video stream
+
+        :param codec: Codec to use instead of the profile's codec
+        :return options: List of ffmpeg options
+        """
+        logger = getLogger(__name__)
+        codec = codec or self.codec
+        logger.debug(f'Encoding video with {self} (codec={codec})')
+
+        options = []
+        if codec:
+            options.extend(['-vcodec', codec])
+        if self.preset:
+            options.extend(['-preset', self.preset])
+        if self.tune:
+            options.extend(['-tune', self.tune])
+        if self.crf is not None:
+            options.extend(['-crf', str(self.crf)])
+        if self.bitrate is not None:
+            options.extend(['-b:v', str(self.bitrate)])
+        if self.gop is not None:
+            options.extend(['-g', str(self.gop)])
+        if self.threads is not None:
+            options.extend(['-threads', str(self.threads)])
+
+        return options
@@ -0,0 +1,206 @@
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from FilmPy.constants import *
+from itertools import islice
+from logging import getLogger
+
+
+def _map_chunk(function, chunk):
+    """
+    Apply the function to each set of arguments in a chunk.
+    Defined at module level, so process pools are able to pickle it.
+
+    :param function: Function to apply
+    :param chunk: List of argument tuples, one per frame
+    :return results: List of the function's results, in the same order as the chunk
+    """
+    return [function(*arguments) for arguments in chunk]
+
+
+def _map_chunk_into(function, destination, chunk_start:int, chunk):
+    """
+    Apply the function to each set of arguments in a chunk, writing the results into destination in place.
+    Defined at module level, so process pools are able to pickle it.
+
+    :param function: Function to apply
+    :param destination: Frames the results are written to (SharedFrames, when run in a worker process)
+    :param chunk_start: Index in destination of the chunk's first result
+    :param chunk: List of argument tuples, one per frame
+    :return number_frames: Number of frames written
+    """
+    for frame_offset, arguments in enumerate(chunk):
+        destination[chunk_start + frame_offset] = function(*arguments)
+
+    return len(chunk)
+
+
+class FrameExecutor:
+    """
+    Maps per-frame transforms across a pool of workers.
+    Frames are handed out in chunks, and the results are returned in the same order as the frames.
+    """
+    # Defaults used by new executors (see FrameExecutor.configure / Editor.configure_executor)
+    _configuration = {'executor': DEFAULT_EXECUTOR,
+                      'workers': DEFAULT_EXECUTOR_WORKERS,
+                      'chunk_size': DEFAULT_EXECUTOR_CHUNK_SIZE}
+
+    def __init__(self, executor=None, workers=None, chunk_size=None):
+        """
+        Instantiate a frame executor, any argument not supplied uses the configured default
+
+        :param executor: Kind of executor to use (see ExecutorType)
+        :param workers: Number of workers, None uses every core
+        :param chunk_size: Number of frames handed to a worker at a time
+        :raises ValueError: When an invalid executor, worker count or chunk size is received
+        """
+        configuration = self.configuration()
+        executor = configuration['executor'] if executor is None else executor
+        workers = configuration['workers'] if workers is None else workers
+        chunk_size = configuration['chunk_size'] if chunk_size is None else chunk_size
+
+        # Ensure the executor is valid
+        if isinstance(executor, Enum):
+            executor = executor.value
+        if executor not in [executor_type.value for executor_type in ExecutorType]:
+            raise ValueError(f"'{executor}' is not a valid executor.")
+
+        # Ensure we have a positive number of workers and frames per chunk
+        workers = int(workers) if workers else (os.cpu_count() or 1)
+        if (workers < 1) or (int(chunk_size) < 1):
+            raise ValueError(f"workers ({workers}) and chunk_size ({chunk_size}) must be at least 1.")
+
+        self._executor = {'executor': executor,
+                          'workers': workers,
+                          'chunk_size': int(chunk_size)}
+
+    @property
+    def chunk_size(self) -> int:
+        """
+        Number of frames handed to a worker at a time
+        """
+        return self._executor['chunk_size']
+
+    @property
+    def executor(self) -> str:
+        """
+        Kind of executor (see ExecutorType)
+        """
+        return self._executor['executor']
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of workers frames are spread across
+        """
+        return self._executor['workers']
+
+    @classmethod
+    def configuration(cls) -> dict:
+        """
+        Defaults used by new executors
+
+        :return configuration: {'executor': ..., 'workers': ..., 'chunk_size': ...}
+        """
+        return dict(cls._configuration)
+
+    @classmethod
+    def configure(cls, executor=None, workers=None, chunk_size=None):
+        """
+        Set the defaults used by new executors, any argument not supplied is unchanged
+
+        :param executor: Kind of executor to use (see ExecutorType)
+        :param workers: Number of workers, 0 uses every core
+        :param chunk_size: Number of frames handed to a worker at a time
+        """
+        logger = getLogger(__name__)
+        logger.debug(f'{cls.__name__}.configure(executor={executor}, workers={workers}, chunk_size={chunk_size})')
+
+        # Validate the configuration, by instantiating an executor with it
+        configuration = cls.configuration()
+        if executor is not None:
+            configuration['executor'] = executor.value if isinstance(executor, Enum) else executor
+        if workers is not None:
+            configuration['workers'] = int(workers) or None
+        if chunk_size is not None:
+            configuration['chunk_size'] = int(chunk_size)
+        cls(**configuration)
+
+        cls._configuration = configuration
+
+    def map(self, function, *iterables):
+        """
+        Apply the function to every frame, like the builtin map().
+        Frames are consumed lazily, with at most two chunks per worker in flight, so frames can be streamed.
+
+        :param function: Function of a frame (and an item of each of the other iterables). The process executor
+                         requires a picklable function, such as a staticmethod or a functools.partial of one
+        :param iterables: Iterable of frames, followed by any iterables of additional arguments
+        :return: Generator of the function's results, in the same order as the frames
+        """
+        logger = getLogger(__name__)
+        arguments = zip(*iterables)
+
+        # Nothing to be gained from a pool, so apply the function in this thread
+        if (self.executor == ExecutorType.SERIAL.value) or (self.workers == 1):
+            for frame_arguments in arguments:
+                yield function(*frame_arguments)
+            return
+
+        # Hand the frames out in chunks, keeping the results in the order the chunks were submitted
+        logger.debug(f'Mapping frames across {self.workers} {self.executor} workers, {self.chunk_size} at a time')
+        pool_class = ThreadPoolExecutor if self.executor == ExecutorType.THREAD.value else ProcessPoolExecutor
+        with pool_class(max_workers=self.workers) as pool:
+            pending_chunks = deque()
+            for chunk in iter(lambda: list(islice(arguments, self.chunk_size)), []):
+                pending_chunks.append(pool.submit(_map_chunk, function, chunk))
+
+                # Limit the frames held in memory, by waiting on the oldest chunk
+                if len(pending_chunks) >= 2 * self.workers:
+                    yield from pending_chunks.popleft().result()
+
+            # Collect the remaining chunks
+            while pending_chunks:
+                yield from pending_chunks.popleft().result()
+
+    def map_into(self, function, destination, *iterables):
+        """
+        Apply the function to every frame, writing each result into destination, in place.
+        With the process executor, frames and destination should be SharedFrames. They are then sent to the workers
+        as references to their shared memory, so frames are not copied between processes.
+
+        :param function: Function of a frame (and an item of each of the other iterables), returning the altered
+                         frame. The process executor requires a picklable function
+        :param destination: Frames (frames, height, width, components) the results are written to
+        :param iterables: Iterable of frames, followed by any iterables of additional arguments
+        :return destination: The destination frames
+        """
+        logger = getLogger(__name__)
+        arguments = zip(*iterables)
+
+        # Nothing to be gained from a pool, so apply the function in this thread
+        if (self.executor == ExecutorType.SERIAL.value) or (self.workers == 1):
+            _map_chunk_into(function, destination, 0, list(arguments))
+            return destination
+
+        # Hand the frames out in chunks, each worker writing its results straight into destination
+        logger.debug(f'Mapping frames into {type(destination).__name__} across {self.workers} {self.executor} '
+                     f'workers, {self.chunk_size} at a time')
+        pool_class = ThreadPoolExecutor if self.executor == ExecutorType.THREAD.value else ProcessPoolExecutor
+        with pool_class(max_workers=self.workers) as pool:
+            pending_chunks = deque()
+            chunk_start = 0
+            for chunk in iter(lambda: list(islice(arguments, self.chunk_size)), []):
+                pending_chunks.append(pool.submit(_map_chunk_into, function, destination, chunk_start, chunk))
+                chunk_start += len(chunk)
+
+                # Limit the chunks in flight, by waiting on the oldest chunk
+                if len(pending_chunks) >= 2 * self.workers:
+                    pending_chunks.popleft().result()
+
+            # Wait for the remaining chunks
+            while pending_chunks:
+                pending_chunks.popleft().result()
+
+        return destination
@@ -1,6 +1,15 @@
+import numpy as np
 import os
+import shutil
 import subprocess
-from FilmPy.constants import AUDIO_CODECS, FFMPEG_BINARY, VIDEO_CODECS
+import tempfile
+from FilmPy.constants import AUDIO_CODECS, BINARY_FFMPEG, STREAM_COPY_ENCODERS, VIDEO_CODECS, WRITER_QUEUE_SIZE
+from FilmPy.clips.Clip import Clip
+from FilmPy.EncoderProfile import EncoderProfile
+from FilmPy.functions import write_frames
+from itertools import groupby
+from logging import getLogger
+from threading import Thread
 
 class Sequence:
     """
@@ -26,17 +35,271 @@ class Sequence:
         # Frames per second of the sequence
         self.fps = 0
 
+        # Determine the fps, and resolution for the sequence
+        self._update_format()
+
+    ###################
+    # Private Methods #
+    ###################
+    @staticmethod
+    def _has_audio(clip):
+        """
+        Does the clip have audio to be written with the sequence
+
+        :param clip: Clip of the sequence
+        :return: True if the clip has audio and its audio is included, False otherwise
+        """
+        return bool(clip.include_audio and (clip.audio_codec_name or clip.has_audio))
+
+    def _iter_audio_frames(self, audio_channels:int, audio_sample_rate:int):
+        """
+        Iterate over the raw audio of every clip in turn, in step with the video. Each clip's audio is cut or padded
+        with silence to the length of the clip's video, and clips without audio (or with audio in another format)
+        are silent. Each clip's audio is only read in once it is reached.
+
+        :param audio_channels: Number of audio channels written
+        :param audio_sample_rate: Sample rate of the audio written
+        :return: Generator of (samples, audio_channels) audio frames
+        """
+        logger = getLogger(__name__)
+        data_type = {1: 'int16', 2: 'int16', 4: 'int32'}[audio_channels]
+
+        # Samples are counted from the start of the sequence, so rounding never accumulates between clips
+        number_video_frames = 0
+        number_samples_written = 0
+        for clip in self._clips:
+            number_video_frames += clip.end_frame - clip.start_frame
+            number_samples = round(number_video_frames / self.fps * audio_sample_rate) - number_samples_written
+            number_samples_written += number_samples
+
+            audio_frames = np.empty((0, audio_channels), dtype=data_type)
+            if self._has_audio(clip) and ((clip.audio_channels, clip.audio_sample_rate)
+                                          != (audio_channels, audio_sample_rate)):
+                logger.warning(f'{type(clip).__name__} audio ({clip.audio_channels} channels at '
+                               f'{clip.audio_sample_rate} Hz) does not match the sequence audio ({audio_channels} '
+                               f'channels at {audio_sample_rate} Hz), it will be silent')
+            elif self._has_audio(clip):
+                audio_frames = np.asarray(clip.get_audio_frames(), dtype=data_type)[:number_samples]
+            if len(audio_frames):
+                yield audio_frames
+
+            # Pad the clip's audio with silence, to the length of its video
+            if len(audio_frames) < number_samples:
+                yield np.zeros((number_samples - len(audio_frames), audio_channels), dtype=data_type)
+
+    def _iter_video_frames(self, queue_size:int=WRITER_QUEUE_SIZE, clips:list=None):
+        """
+        Iterate over the rgb24 video frames of every clip in turn, conformed to the sequence's frame size.
+        Each clip's frames are streamed from its source (unless they were already read in) and are not kept once
+        yielded, so memory is bounded by a few frames rather than by the film.
+
+        :param queue_size: Number of frames that may be waiting to be written, frames are only reused after that
+        :param clips: Clips to iterate over, defaults to all the sequence's clips
+        :return: Generator of (frame_height, frame_width, 3) rgb24 frames
+        """
+        # Canvases for clips smaller than the sequence, enough that a frame is not reused while it is queued
+        canvases = np.zeros((queue_size + 2, self.frame_height, self.frame_width, 3), dtype='uint8')
+        canvas_index = 0
+
+        for clip in (self._clips if clips is None else clips):
+            for frame in clip.iter_video_frames(pixel_format='rgb24'):
+                # Frames the size of the sequence need no conforming
+                frame_height, frame_width = frame.shape[:2]
+                if (frame_width, frame_height) == (self.frame_width, self.frame_height):
+                    yield frame
+                    continue
+
+                # Center smaller frames on a black canvas (cropping any larger dimension)
+                frame_height, frame_width = min(frame_height, self.frame_height), min(frame_width, self.frame_width)
+                top = (self.frame_height - frame_height) // 2
+                left = (self.frame_width - frame_width) // 2
+                canvas = canvases[canvas_index]
+                canvas[:] = 0
+                canvas[top:top + frame_height, left:left + frame_width] = frame[:frame_height, :frame_width]
+                canvas_index = (canvas_index + 1) % len(canvases)
+                yield canvas
+
+    def _stream_copy_ranges(self, write_audio:bool, video_codec:str=None):
+        """
+        Determine which clips can be joined by copying their streams (via ffmpeg's concat demuxer), rather than
+        being decoded and re-encoded. Copied clips must share their video stream parameters (codec, pixel format,
+        profile, level, extradata and time base), the remaining clips are re-encoded to match them.
+
+        :param write_audio: The audio is to be written, audio is only copied when every clip is copied
+        :param video_codec: Video codec requested for the file, None accepts the codec of the copied clips
+        :return ranges: List of each clip's (start time, end time) to copy, or None when the clip is re-encoded.
+                        None when the sequence can not be joined by copying streams
+        """
+        logger = getLogger(__name__)
+
+        # Every clip must already be the size and frame rate of the sequence
+        if (not self._clips) or any(((clip.width, clip.height) != (self.frame_width, self.frame_height))
+                                    or (clip.fps != self.fps) for clip in self._clips):
+            return None
+
+        # Find the clips that can be copied
+        ranges = [clip.get_stream_copy_range(include_audio=write_audio) for clip in self._clips]
+        copied_clips = [clip for clip, copy_range in zip(self._clips, ranges) if copy_range is not None]
+        if not copied_clips:
+            return None
+
+        # Copied clips must share their video stream parameters, which any re-encoded clips must be encoded to
+        video_formats = {clip.video_stream_parameters for clip in copied_clips}
+        if len(video_formats) > 1:
+            logger.debug(f'The clips of the sequence do not share their video stream parameters {video_formats}')
+            return None
+        encoder = STREAM_COPY_ENCODERS.get(video_formats.pop()[0])
+        if (video_codec and (video_codec != encoder)) or ((encoder is None) and (len(copied_clips) < len(ranges))):
+            return None
+
+        # Audio is copied along with the video, so every clip must be copied, with the same audio format
+        audio_clips = [clip for clip in self._clips if clip.audio_codec_name and clip.include_audio]
+        audio_formats = {(clip.audio_codec_name, clip.audio_sample_rate, clip.audio_channels) for clip in audio_clips}
+        if write_audio and audio_clips and ((len(copied_clips) < len(ranges)) or (len(audio_clips) < len(ranges))
+                                            or (len(audio_formats) > 1)):
+            return None
+
+        logger.debug(f'Copying the streams of {len(copied_clips)} of the {len(ranges)} clips in the sequence')
+        return ranges
+
+    def _update_format(self):
+        """
+        Determine the fps (fastest clip) and resolution (largest clip dimensions) of the sequence from its clips
+        """
         # Loop over the clips and determine the fps, and resolution for the sequence
-        for clip in clips:
+        for clip in self._clips:
             if clip.video_fps > self.fps:
                 self.fps = clip.video_fps
 
-            if self.frame_width < clip.video_width:
-                self.frame_width = clip.video_width
+            if self.frame_width < clip.width:
+                self.frame_width = clip.width
 
-            if self.frame_height < clip.video_height:
-                self.frame_height = clip.video_height
+            if self.frame_height < clip.height:
+                self.frame_height = clip.height
         self.frame_size = f"{self.frame_width}x{self.frame_height}"
+
+    @staticmethod
+    def _write_audio_pipe(stream, audio_frames):
+        """
+        Write raw audio frames to a pipe read by ffmpeg, then close the pipe. Meant to be run in its own thread.
+
+        :param stream: Binary stream of the pipe's write end
+        :param audio_frames: Iterable of audio frames to write
+        """
+        logger = getLogger(__name__)
+        try:
+            write_frames(stream, audio_frames, WRITER_QUEUE_SIZE)
+        except OSError as e:
+            logger.warning(f"Unable to write the audio to ffmpeg ({e})")
+        finally:
+            stream.close()
+
+    def _write_segment(self, file_path, clips:list, video_options:list):
+        """
+        Encode the video frames of some of the sequence's clips to a file
+
+        :param file_path: Path of the file to write
+        :param clips: Clips to encode
+        :param video_options: ffmpeg options for encoding the video
+        :raises IOError: When ffmpeg failed to encode the clips
+        """
+        command = [BINARY_FFMPEG,
+                   '-y',                                    # Overwrite output file if it exists
+                   '-loglevel', 'error',                    # Only notify us of errors
+                   '-f', 'rawvideo',                        #
+                   '-vcodec', 'rawvideo',                   #
+                   '-s', self.frame_size,                   # size of one frame
+                   '-pix_fmt', 'rgb24',                     # pixel format
+                   '-r', '%f' % self.fps,                   # frames per second of the sequence
+                   '-i', '-',                               # the input comes from a pipe
+                   '-an'] + video_options + [file_path]
+
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE, bufsize=0)
+        try:
+            write_frames(process.stdin, self._iter_video_frames(WRITER_QUEUE_SIZE, clips), WRITER_QUEUE_SIZE)
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode:
+            raise IOError(f"ffmpeg failed to encode the segment '{file_path}'")
+
+    def _write_stream_copy(self, file_path, ranges:list, write_audio:bool, encoder_profile:EncoderProfile):
+        """
+        Join the clips via ffmpeg's concat demuxer, copying the streams of the unaltered clips as they are,
+        and re-encoding each run of the remaining clips as a segment matching them.
+        Nothing is written when a re-encoded segment's video stream parameters (e.g. its SPS / PPS) do not match
+        those of the copied clips, as their packets could not be decoded as a single stream.
+
+        :param file_path: Output video's file path
+        :param ranges: Each clip's (start time, end time) to copy, or None when the clip is re-encoded
+        :param write_audio: Should we copy the audio as well as the video?
+        :param encoder_profile: EncoderProfile the re-encoded clips are encoded with
+        :raises IOError: When ffmpeg failed to encode or join the clips
+        :return joined: True when the clips were joined, False when the sequence must be re-encoded instead
+        """
+        logger = getLogger(__name__)
+        file_name, ext = os.path.splitext(os.path.basename(file_path))
+
+        # Re-encoded clips are encoded to the format (and for mp4 / mov, the time base) of the copied clips
+        copied_clip = next(clip for clip, copy_range in zip(self._clips, ranges) if copy_range is not None)
+        video_options = encoder_profile.video_options(STREAM_COPY_ENCODERS.get(copied_clip.video_codec_name)) + [
+                        '-pix_fmt', copied_clip.video_pixel_format]
+        time_base = str(copied_clip.video_stream_parameters[-1] or '')
+        if (ext.lower() in ('.mp4', '.m4v', '.mov')) and time_base.startswith('1/'):
+            video_options += ['-video_track_timescale', time_base[2:]]
+
+        segment_directory = tempfile.mkdtemp(prefix=f'{file_name}_concat_')
+        try:
+            # List the copied clips and the re-encoded segments, in order, for the concat demuxer
+            concat_list = []
+            for copied, clip_ranges in groupby(zip(self._clips, ranges), key=lambda item: item[1] is not None):
+                clip_ranges = list(clip_ranges)
+                if not copied:
+                    segment_path = os.path.join(segment_directory, f'segment_{len(concat_list):04d}{ext}')
+                    self._write_segment(segment_path, [clip for clip, _ in clip_ranges], video_options)
+
+                    # The segment's packets are joined with the copied packets, so its stream must match theirs
+                    segment_parameters = Clip(file_path=segment_path).video_stream_parameters
+                    if segment_parameters != copied_clip.video_stream_parameters:
+                        logger.debug(f'Re-encoded segment {segment_parameters} does not match the copied clips '
+                                     f'{copied_clip.video_stream_parameters}')
+                        return False
+                    concat_list.append((segment_path, None, None))
+                    continue
+
+                concat_list.extend((clip.file_path, start_time, end_time)
+                                   for clip, (start_time, end_time) in clip_ranges)
+
+            list_path = os.path.join(segment_directory, 'concat.txt')
+            with open(list_path, 'w') as f:
+                for concat_path, start_time, end_time in concat_list:
+                    concat_path = os.path.abspath(concat_path).replace("'", "'\\''")
+                    f.write(f"file '{concat_path}'\n")
+                    if start_time is not None:
+                        f.write(f"inpoint {start_time}\n")
+                    if end_time is not None:
+                        f.write(f"outpoint {end_time}\n")
+
+            # Join the files, copying their packets rather than re-encoding them
+            command = [BINARY_FFMPEG,
+                       '-y',                                # Overwrite output file if it exists
+                       '-loglevel', 'error',                # Only notify us of errors
+                       '-f', 'concat',                      # Concatenate the files listed
+                       '-safe', '0',                        # Allow absolute paths in the list
+                       '-i', list_path,
+                       '-map', '0:v:0']
+            command.extend(['-map', '0:a:0?'] if write_audio else ['-an'])
+            command.extend(['-c', 'copy', file_path])
+
+            logger.debug(f"Calling ffmpeg to join the clips \"{' '.join(command)}\"")
+            completed_process = subprocess.run(command, capture_output=True)
+            if completed_process.returncode:
+                raise IOError(f"ffmpeg was unable to join the clips: {completed_process.stderr.decode('utf8')}")
+        finally:
+            shutil.rmtree(segment_directory, ignore_errors=True)
+
+        return True
+
     ##################
     # Public Methods #
     ##################
@@ -52,108 +315,134 @@ class Sequence:
         else:
             self._clips.append(clip)
 
+        # The clip may be larger or faster than the sequence's clips thus far
+        self._update_format()
+
 
     def write_video_file(self,
                          file_path,
                          write_audio=True,
                          output_audio_codec=None,
-                         output_video_codec=None):
+                         output_video_codec=None,
+                         encoder_profile=None,
+                         stream_copy:bool=False):
         """
         Writes this clip to a video file
 
         :param file_path: Output video's file path
         :param write_audio: Should we write the audio as well as the video? Default is True.
         :param output_audio_codec: Audio Codec to use when writing the file
-        :param output_video_codec: Video Codec to use when writing the file
+        :param output_video_codec: Video Codec to use when writing the file, overrides the encoder profile's codec
+        :param encoder_profile: EncoderProfile, profile name (see ENCODER_PROFILES) or dict of settings,
+                                defaults to DEFAULT_ENCODER_PROFILE
+        :param stream_copy: Copy the streams of unaltered file clips, rather than re-encoding them, when the clips
+                            share their video stream parameters. Copied clips keep their own encoding, only the clips
+                            that need it are re-encoded (to match them) with the encoder profile. Default is False.
+        :raises ValueError: When there is no video codec for the file's extension, or the profile is invalid
+        :raises IOError: When ffmpeg failed to write the file
         """
+        logger = getLogger(__name__)
+        encoder_profile = EncoderProfile.from_value(encoder_profile)
+
         # Get filename and extension from the file path
         file_name, ext = os.path.splitext(os.path.basename(file_path))
         ext = ext[1:].lower()
 
+        # Unaltered clips are joined by copying their streams, only re-encoding the clips that need it
+        ranges = self._stream_copy_ranges(write_audio, output_video_codec or encoder_profile.codec) if stream_copy else None
+        if (ranges is not None) and self._write_stream_copy(file_path, ranges, write_audio, encoder_profile):
+            return
+
         # Ensure we were given a video codec or have a default for this file extension
-        if (output_video_codec is None) and (ext in VIDEO_CODECS):
+        output_video_codec = output_video_codec or encoder_profile.codec
+        if output_video_codec is None:
+            if ext not in VIDEO_CODECS:
+                raise ValueError(f"No default video codec found for '{ext}'")
             output_video_codec = VIDEO_CODECS[ext][0]
-        else:
-            raise ValueError(f"No default video codec found for '{ext}'")
 
         # Ensure we were given an audio codec or have a default for this file extension
         # otherwise default to 'libmp3lame'
-        if (output_audio_codec is None) and (ext in AUDIO_CODECS):
-            output_audio_codec = AUDIO_CODECS[ext][0]
-        else:
-            output_audio_codec = "libmp3lame"
-
-        # Determine audio extension
-        audio_extension = None
-        for extension, extension_codecs in AUDIO_CODECS.items():
-            if output_audio_codec in extension_codecs:
-                audio_extension = extension
+        if output_audio_codec is None:
+            output_audio_codec = AUDIO_CODECS[ext][0] if ext in AUDIO_CODECS else "libmp3lame"
 
         # Write the video to the file
-        command = [FFMPEG_BINARY,
+        command = [BINARY_FFMPEG,
                    '-y',                                    # Overwrite output file if it exists
+                   '-loglevel', 'error',                    # Only notify us of errors
                    '-f', 'rawvideo',                        #
                    '-vcodec', 'rawvideo',                   #
                    '-s', self.frame_size,                   # size of one frame, use the Sequence's fps value
                    '-pix_fmt', 'rgb24',                     # pixel format
                    '-r', '%f' % self.fps,                   # frames per second of the sequence
-                   '-i', '-',                               # the input comes from a pipe
-                   '-an']                                   # tells FFMPEG not to expect any audio
-
-        # If we have an audio stream and we are to write audio
-        if write_audio:
-            # TODO: Pull this data from audio_stream or somewhere...
-            # Audio Info
-            fps = 44100
-            number_channels = 2
-            number_bytes = 2
-
-            audio_data = []
-            for clip in self._clips:
-                # If the clip has audio and the audio should be written add it to the array
-                # of audio data we will write
-                if clip.has_audio and clip.include_audio:
-                    audio_data.extend(clip.get_audio_frames(clip.file_path, fps, number_bytes, number_channels))
-
-            temp_audio_file_name = f"{file_name}_wvf_snd.tmp.{audio_extension}"
-
-            # FFMPEG Command to write audio to a file
-            ffmpeg_command = [
-                FFMPEG_BINARY, '-y',
-                '-loglevel', 'error',
-                "-f", 's%dle' % (8 * number_bytes),
-                "-acodec", 'pcm_s%dle' % (8 * number_bytes),
-                '-ar', "%d" % fps,
-                '-ac', "%d" % number_channels,
-                '-i', '-',
-                temp_audio_file_name]
-
-            # Write all the data (via ffmpeg) to the temp file
-            process = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, bufsize=10 ** 8)
-            for ad in audio_data:
-                process.stdin.write(ad.tobytes())
-            process.stdin.close()
-            process.wait()
-
-            # Extend the command to pass in the audio we just recorded
-            command.extend([
-                '-i', temp_audio_file_name,
-                '-acodec', 'copy'
-            ])
+                   '-i', '-']                               # the input comes from a pipe
 
-        video_frames = []
-        for clip in self._clips:
-            video_frames.extend(clip.get_video_frames())
+        # The audio is written in the format of the first clip with audio, only when a clip has audio
+        audio_clip = next((clip for clip in self._clips if self._has_audio(clip)), None) if write_audio else None
+        audio_file_name = None
+        audio_read_descriptor = None
+        audio_write_descriptor = None
+        if audio_clip is not None:
+            audio_channels, audio_sample_rate = audio_clip.audio_channels, audio_clip.audio_sample_rate
+            audio_input = ['-f', 's8' if audio_channels == 1 else 's%dle' % (8 * audio_channels),
+                           '-acodec', 'pcm_u8' if audio_channels == 1 else 'pcm_s%dle' % (8 * audio_channels),
+                           '-ar', '%d' % audio_sample_rate,
+                           '-ac', '%d' % audio_channels]
+            audio_frames = self._iter_audio_frames(audio_channels, audio_sample_rate)
+            if os.name == 'posix':
+                # Raw audio is fed to this same ffmpeg process through a second pipe, and encoded along with the video
+                audio_read_descriptor, audio_write_descriptor = os.pipe()
+                command.extend(audio_input + ['-i', f'pipe:{audio_read_descriptor}'])
+            else:
+                # We can not pass ffmpeg a second pipe, so write the raw audio to a uniquely named scratch file
+                file_descriptor, audio_file_name = tempfile.mkstemp(prefix=f'{file_name}_wvf_snd_', suffix='.raw')
+                with open(file_descriptor, 'wb') as f:
+                    for audio_frame in audio_frames:
+                        f.write(np.ascontiguousarray(audio_frame))
+                command.extend(audio_input + ['-i', audio_file_name])
+            command.extend(['-acodec', output_audio_codec])
+        else:
+            command.extend(['-an'])                         # tells FFMPEG not to write any audio
 
         # Parameters relating to the final outputted file
+        command.extend(encoder_profile.video_options(output_video_codec))
         command.extend([
-            '-preset', 'medium',
             '-pix_fmt', 'yuv420p',
             file_path])
 
-        # Write all the video frame data to the PIPE's standard input
-        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE,  bufsize=10 ** 8)
-        for frame in video_frames:
-            process.stdin.write(frame.tobytes())
-        process.stdin.close()
-        process.wait()
\ No newline at end of file
+        # Start ffmpeg, handing it the read end of the audio pipe (if any)
+        logger.debug(f"Calling ffmpeg to write the sequence \"{' '.join(command)}\"")
+        pass_descriptors = () if audio_read_descriptor is None else (audio_read_descriptor,)
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE, bufsize=0,
+                                       pass_fds=pass_descriptors)
+        except BaseException:
+            if audio_write_descriptor is not None:
+                os.close(audio_write_descriptor)
+            raise
+        finally:
+            if audio_read_descriptor is not None:
+                os.close(audio_read_descriptor)
+
+        # Write the audio to its pipe from another thread, as ffmpeg reads the audio and video as it needs them
+        audio_writer = None
+        if audio_write_descriptor is not None:
+            audio_writer = Thread(target=self._write_audio_pipe,
+                                  args=(open(audio_write_descriptor, 'wb', buffering=0), audio_frames),
+                                  name='write_audio', daemon=True)
+            audio_writer.start()
+
+        # Write all the video frame data to the PIPE's standard input, from a background thread
+        # Frames are streamed from each clip in turn, so the whole sequence is never held in memory at once
+        try:
+            write_frames(process.stdin, self._iter_video_frames(WRITER_QUEUE_SIZE), WRITER_QUEUE_SIZE)
+        finally:
+            process.stdin.close()
+            if audio_writer:
+                audio_writer.join()
+            process.wait()
+
+            # Delete the audio scratch file as needed
+            if audio_file_name:
+                os.remove(audio_file_name)
+        if process.returncode:
+            raise IOError(f"ffmpeg failed to write the sequence to '{file_path}'")
@@ -0,0 +1,131 @@
+import numpy as np
+import weakref
+
+from multiprocessing import shared_memory
+
+# Shared memory blocks this process has attached to, keyed by name
+_attached_memory = {}
+
+
+def _attach_shared_frames(name:str, shape:tuple, offset:int):
+    """
+    Rebuild frames from a reference to their shared memory block, rather than from a copy of them.
+    Used when unpickling SharedFrames, e.g. in a worker process.
+
+    :param name: Name of the shared memory block
+    :param shape: Shape of the frames
+    :param offset: Offset, in bytes, of the frames within the shared memory block
+    :return frames: SharedFrames, reading and writing the shared memory block in place
+    """
+    # Only attach to each block once per process
+    memory = _attached_memory.get(name)
+    if memory is None:
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13, shared memory is always tracked
+            memory = shared_memory.SharedMemory(name=name)
+        _attached_memory[name] = memory
+
+    return SharedFrames(shape, memory=memory, offset=offset)
+
+
+def _release_shared_memory(memory):
+    """
+    Close and remove a shared memory block, once no frames reference it any longer
+
+    :param memory: SharedMemory block to release
+    """
+    try:
+        memory.close()
+    except BufferError:
+        pass
+
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SharedFrames(np.ndarray):
+    """
+    uint8 frames stored in a multiprocessing.shared_memory block.
+    When pickled (e.g. sent to a worker process) only a reference to the block is sent,
+    so other processes read and write the frames in place.
+    """
+
+    def __new__(cls, shape:tuple, memory=None, offset:int=0):
+        """
+        Allocate uninitialized frames in a new shared memory block, or view an existing block
+
+        :param shape: Shape of the frames, e.g. (frames, height, width, components)
+        :param memory: Existing SharedMemory block, if None a block is created and removed once unreferenced
+        :param offset: Offset, in bytes, of the frames within the shared memory block
+        :return frames: SharedFrames
+        """
+        # Create a shared memory block, large enough for the frames
+        owner = memory is None
+        if owner:
+            memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape))))
+
+        frames = super().__new__(cls, shape, dtype='uint8', buffer=memory.buf, offset=offset)
+        frames.shared_memory = memory
+
+        # Remove the shared memory block, once nothing references these frames any longer
+        if owner:
+            weakref.finalize(frames, _release_shared_memory, memory)
+
+        return frames
+
+    def __array_finalize__(self, obj):
+        """
+        Views of shared frames remain in the shared memory block, other arrays derived from them do not
+        """
+        if (getattr(obj, 'shared_memory', None) is not None) and np.may_share_memory(self, obj):
+            self.shared_memory = obj.shared_memory
+        else:
+            self.shared_memory = None
+
+    def __array_wrap__(self, array, context=None, return_scalar=False):
+        """
+        Results of numpy operations on shared frames are new arrays, outside of the shared memory block
+        """
+        array = super().__array_wrap__(array, context)
+
+        if (self is array) or (type(self) is not SharedFrames):
+            return array
+        if return_scalar:
+            return array[()]
+
+        return array.view(np.ndarray)
+
+    def __reduce__(self):
+        """
+        Contiguous frames in a shared memory block are pickled as a reference to the block, anything else is copied
+        """
+        if (self.shared_memory is None) or not self.flags.c_contiguous:
+            return np.asarray(self).__reduce__()
+
+        return _attach_shared_frames, (self.shared_memory.name, self.shape, self.shared_memory_offset)
+
+    @property
+    def shared_memory_offset(self) -> int:
+        """
+        Offset, in bytes, of these frames within their shared memory block
+        """
+        start = np.frombuffer(self.shared_memory.buf, dtype='uint8', count=1).__array_interface__['data'][0]
+        return self.__array_interface__['data'][0] - start
+
+    @classmethod
+    def from_frames(cls, video_frames):
+        """
+        Copy frames into a new shared memory block
+
+        :param video_frames: List of frames, or a (frames, height, width, components) array
+        :return frames: SharedFrames holding a copy of the frames
+        """
+        frames = cls((len(video_frames),) + tuple(video_frames[0].shape))
+        for frame_index, frame in enumerate(video_frames):
+            frames[frame_index] = frame
+
+        return frames
@@ -1,21 +1,41 @@
+import atexit
+import copy
 import json
 import os
 import numpy
 import numpy as np
 import subprocess
+import shutil
+import tempfile
 
 from FilmPy.constants import *
+from FilmPy.EncoderProfile import EncoderProfile
+from FilmPy.FrameExecutor import FrameExecutor
+from FilmPy.SharedFrames import SharedFrames
+from FilmPy.functions import convert_rgb24_to_gray, rational_to_float, write_frames
+from functools import partial
+from itertools import count, islice
 from logging import getLogger
 from PIL import Image, ImageFilter
-from random import randint
 from subprocess import DEVNULL, PIPE
-from ffmpeg import FFmpeg
+from threading import Thread
+
+# File locking is only available on POSIX, elsewhere the disk cache of file information is written unlocked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class Clip:
     """
     Base class for all clips.
     """
+    # File information already retrieved, keyed by (file path, file size, file modification time)
+    _file_information_cache = {}
+
+    # Disk caches loaded into the file information cache, and the keys added since they were loaded
+    _file_information_cache_files = {}
 
     def __init__(self,
                  audio_avg_frame_rate=None,
@@ -40,13 +60,18 @@ class Clip:
                  audio_start_time=None,
                  audio_time_base=None,
                  clip_behavior=Behavior.ENFORCE_LIMIT.value,
+                 clip_blend_mode=BlendMode.MASK.value,
                  clip_end_time=None,
                  clip_fps=None,
+                 clip_frame_accurate=False,
+                 clip_frame_store=FrameStore.LIST.value,
+                 clip_lazy=False,
                  clip_start_time=0,
                  clip_width=None,
                  file_path=None,
                  clip_height=None,
                  clip_include_audio=None,
+                 clip_opacity:float=1.0,
                  clip_position=(0,0),
                  clip_pixel_format='rgb24',
                  mask_frames=None,
@@ -72,6 +97,7 @@ class Clip:
                  video_height=None,
                  video_is_avc=None,
                  video_end_time=None,
+                 video_exact_frame_count=False,
                  video_fps=None,
                  video_frames=None,
                  video_get_frame=None,
@@ -115,16 +141,22 @@ class Clip:
         :param audio_start_time:
         :param audio_time_base:
         :param clip_behavior: How should we behave when the end time exceeds the clip frames we have.
+        :param clip_blend_mode: How the clip is blended with the clips beneath it, when composited (see BlendMode)
         :param clip_end_time:
         :param clip_fps:
+        :param clip_frame_accurate: Should seeking within the file check each frame's timestamp (slower, exact)
+        :param clip_frame_store: How the video frames are stored in memory (see FrameStore)
+        :param clip_lazy: Should effects be recorded, and applied in a single pass when the frames are needed
         :param clip_start_time:
         :param clip_width:
         :param file_path:
         :param clip_height:
         :param clip_include_audio:
+        :param clip_opacity: Opacity (0 to 1) of the clip, when composited
         :param clip_position:
         :param clip_pixel_format:
-        :param mask_frames:
+        :param mask_frames: Mask frames, bitmaps (bool, True where the clip is visible) or alpha planes (uint8,
+                            0 transparent to 255 opaque). Only the first component of each mask frame is kept
         :param mask_behavior:
         :param video_avg_frame_rate:
         :param video_bit_rate:
@@ -143,6 +175,8 @@ class Clip:
         :param video_height:
         :param video_is_avc:
         :param video_end_time:
+        :param video_exact_frame_count: Count the file's video frames by decoding them, if the container does not
+                                        store the number of frames. Otherwise, packets are counted or it is estimated.
         :param video_fps:
         :param video_frames:
         :param video_get_frame: function to be used to generate video frames
@@ -163,6 +197,7 @@ class Clip:
         :param kwargs: Catchall for unexpected keyword arguments
 
         :raises ValueError: When invalid clip_pixel_format received
+        :raises ValueError: When invalid clip_frame_store received
         """
         # TODO: Raise a ValueError if we have no valid data
         # print(file_path, video_frames, audio_frames)
@@ -176,7 +211,9 @@ class Clip:
         if os.path.exists(ENVIRONMENT_FILE):
             with open(ENVIRONMENT_FILE) as f:
                 for line in f.readlines():
-                    key, val = line.split('=')
+                    if not line.strip():
+                        continue
+                    key, val = line.strip().split('=', 1)
                     self._environment[key] = val
 
         # Warn the user they sent an argument we are not expecting
@@ -187,6 +224,20 @@ class Clip:
         if clip_pixel_format not in PIXEL_FORMATS.keys():
             raise ValueError(f"'{clip_pixel_format}' is not a valid value for clip_pixel_format.")
 
+        # Ensure the clip frame store is valid
+        if isinstance(clip_frame_store, Enum):
+            clip_frame_store = clip_frame_store.value
+        if clip_frame_store not in [frame_store.value for frame_store in FrameStore]:
+            raise ValueError(f"'{clip_frame_store}' is not a valid value for clip_frame_store.")
+
+        # Ensure the clip blend mode and opacity are valid
+        if isinstance(clip_blend_mode, Enum):
+            clip_blend_mode = clip_blend_mode.value
+        if clip_blend_mode not in [blend_mode.value for blend_mode in BlendMode]:
+            raise ValueError(f"'{clip_blend_mode}' is not a valid value for clip_blend_mode.")
+        if not (0 <= float(clip_opacity) <= 1):
+            raise ValueError(f"clip_opacity ({clip_opacity}) must be between 0 and 1.")
+
         audio_frames_initialized = True if audio_frames else False
         # Audio Specific Attributes
         self._audio = { 'average_frame_rate': audio_avg_frame_rate,
@@ -203,6 +254,7 @@ class Clip:
                         'get_frame': audio_get_frame,
                         'frames': audio_frames,
                         'frames_initialized': audio_frames_initialized,
+                        'frames_start_time': 0.0,                        # Clip time of the first audio frame held
                         'number_frames': audio_nb_frames,
                         'profile': audio_profile,
                         'r_frame_rate': audio_r_frame_rate,
@@ -215,12 +267,17 @@ class Clip:
         # Clip specific attributes
         self._clip = {
                            'behavior': clip_behavior,
+                           'blend_mode': clip_blend_mode,                 # How the clip is blended when composited
                            'end_time': clip_end_time,                     # End time of the clip itself
                            'fps': clip_fps,                               # Frames per second for the clip
+                           'frame_accurate': clip_frame_accurate,         # Check frame timestamps when seeking
+                           'frame_store': clip_frame_store,               # How video frames are stored in memory
                            'height': clip_height,                         # Height (in pixels) of the clip
                            'include_audio': clip_include_audio,           # Should the audio be included when rendered
+                           'lazy': clip_lazy,                             # Record effects, rather than apply them
                            'pixel_format': clip_pixel_format,             # Pixel format to use while video processing
                            'number_frames': None,                         # Number of video frames in the clip
+                           'opacity': float(clip_opacity),                # Opacity of the clip when composited
                            'position_x': int(clip_position[0]),           # x coordinate for the clip
                            'position_y': int(clip_position[1]),           # y coordinate for the clip
                            'start_time': clip_start_time,                 # Start time in seconds
@@ -228,7 +285,8 @@ class Clip:
                       }
 
         # Video specific attributes
-        video_frames, video_frames_initialized = ([],False) if not video_frames else (video_frames,True)
+        video_frames_initialized = (video_frames is not None) and (len(video_frames) > 0)
+        video_frames = video_frames if video_frames_initialized else []
         self._video = {     'average_frame_rate': video_avg_frame_rate,
                             'bit_rate': video_bit_rate,
                             'bits_per_raw_sample': video_bits_per_raw_sample,
@@ -251,11 +309,13 @@ class Clip:
                             'get_frame': video_get_frame,
                             'frames': video_frames,                          # Frames for the underlying video
                             'frames_initialized':  video_frames_initialized, # Do we have the frames already?
+                            'frames_start_time': 0.0,                        # Clip time of the first frame held
                             'has_b_frames': video_has_b_frames,
                             'is_avc': video_is_avc,
                             'height': video_height,
                             'level': video_level,
                             'nal_length_size': video_nal_length_size,
+                            'operations': [],                                # Effects pending on the frames
                             'pixel_format': video_pix_fmt,
                             'profile': video_profile,
                             'refs': video_refs,
@@ -270,18 +330,30 @@ class Clip:
         # File specific attributes
         self._file_path = file_path  # Path to whatever file is associated to this clip
         if file_path:
-            for arg, val in self._set_file_information(file_path).items():
+            for arg, val in self._set_file_information(file_path, video_exact_frame_count,
+                                                       self.metadata_cache_file).items():
                 if arg.startswith('audio'):
                     self._audio[arg.replace('audio_','')] = val
                 elif arg.startswith('video'):
                     self._video[arg.replace('video_','')] = val
 
-        # Mask specific attributes
-        self._mask = {'frames':mask_frames,
+        # Mask specific attributes, stored as single channel mask frames
+        mask_behavior = mask_behavior.value if isinstance(mask_behavior, Enum) else mask_behavior
+        mask_frames = [self._compact_mask_frame(mask_frame) for mask_frame in
+                       ([] if mask_frames is None else mask_frames)]
+
+        # Looped masks that hide nothing are not stored, and a single looped mask frame is used for every frame
+        mask_type = MaskType.FRAMES.value
+        if not mask_frames:
+            mask_type = MaskType.OPAQUE.value
+        elif mask_behavior == Behavior.LOOP_FRAMES.value:
+            if all(self._is_opaque_mask_frame(mask_frame) for mask_frame in mask_frames):
+                mask_type, mask_frames = MaskType.OPAQUE.value, []
+            elif len(mask_frames) == 1:
+                mask_type = MaskType.STATIC.value
+        self._mask = {'frames': mask_frames,
                       'behavior': mask_behavior,
-                      'initialized': False}
-        if isinstance(self._mask['behavior'], Enum):
-            self._mask['behavior'] = self._mask['behavior'].value
+                      'type': mask_type}
 
         ###########################################
         # Post array initialization, logic checks #
@@ -312,6 +384,13 @@ class Clip:
         """
         self._audio['channels'] = int(value)
 
+    @property
+    def audio_codec_name(self) -> str | None:
+        """
+        Codec of the audio stream in the clip's file, e.g. 'aac'
+        """
+        return self._audio['codec_name']
+
     @property
     def audio_number_frames(self):
         """
@@ -432,6 +511,131 @@ class Clip:
 
         return DEFAULT_FRAME_RATE
 
+    @property
+    def encoder_profile(self) -> EncoderProfile:
+        """
+        Encoder profile used when writing this clip to a file, unless one is passed to the write method
+        """
+        if 'ENCODER_PROFILE' in self._environment:
+            return EncoderProfile.from_value(self._environment['ENCODER_PROFILE'])
+
+        return EncoderProfile(DEFAULT_ENCODER_PROFILE)
+
+    @encoder_profile.setter
+    def encoder_profile(self, value):
+        """
+        Set the encoder profile used when writing this clip to a file
+        :param value: EncoderProfile, name of a profile (see ENCODER_PROFILES) or dict of settings
+        :raises ValueError: When value is not a valid encoder profile
+        """
+        self._environment['ENCODER_PROFILE'] = EncoderProfile.from_value(value)
+
+    @property
+    def executor(self) -> str:
+        """
+        Executor per-frame effects run on (see ExecutorType)
+        """
+        if 'EXECUTOR' in self._environment:
+            return self._environment['EXECUTOR']
+
+        return FrameExecutor.configuration()['executor']
+
+    @executor.setter
+    def executor(self, value):
+        """
+        Set the executor used by this clip's per-frame effects
+        :param value: ExecutorType (or its value)
+        :raises ValueError: When value is not a valid executor
+        """
+        if isinstance(value, Enum):
+            value = value.value
+        if value not in [executor_type.value for executor_type in ExecutorType]:
+            raise ValueError(f"'{value}' is not a valid executor.")
+
+        self._environment['EXECUTOR'] = value
+
+    @property
+    def executor_chunk_size(self) -> int:
+        """
+        Number of frames handed to an executor worker at a time
+        """
+        if 'EXECUTOR_CHUNK_SIZE' in self._environment:
+            return int(self._environment['EXECUTOR_CHUNK_SIZE'])
+
+        return FrameExecutor.configuration()['chunk_size']
+
+    @executor_chunk_size.setter
+    def executor_chunk_size(self, value):
+        """
+        Set the number of frames handed to an executor worker at a time
+        :param value:
+        """
+        self._environment['EXECUTOR_CHUNK_SIZE'] = int(value)
+
+    @property
+    def executor_workers(self) -> int | None:
+        """
+        Number of executor workers per-frame effects are spread across, None uses every core
+        """
+        if 'EXECUTOR_WORKERS' in self._environment:
+            return int(self._environment['EXECUTOR_WORKERS']) or None
+
+        return FrameExecutor.configuration()['workers']
+
+    @executor_workers.setter
+    def executor_workers(self, value):
+        """
+        Set the number of executor workers, 0 or None uses every core
+        :param value:
+        """
+        self._environment['EXECUTOR_WORKERS'] = int(value or 0)
+
+    @property
+    def memory_budget(self) -> int:
+        """
+        Bytes of video frames a clip may hold in memory, before its frames are memory mapped to a scratch file
+        """
+        if 'MEMORY_BUDGET' in self._environment:
+            return int(self._environment['MEMORY_BUDGET'])
+
+        return DEFAULT_MEMORY_BUDGET
+
+    @memory_budget.setter
+    def memory_budget(self, value):
+        """
+        Set the memory budget for this clip
+        :param value: Memory budget in bytes
+        """
+        self._environment['MEMORY_BUDGET'] = int(value)
+
+    @property
+    def metadata_cache_file(self):
+        """
+        File the file information of probed files is cached in, between processes. None disables the disk cache
+        """
+        if 'METADATA_CACHE_FILE' in self._environment:
+            return self._environment['METADATA_CACHE_FILE'] or None
+
+        return DEFAULT_METADATA_CACHE_FILE
+
+    @property
+    def scratch_directory(self):
+        """
+        Directory memory mapped video frames are written to. None will use the system's temp directory
+        """
+        if 'SCRATCH_DIRECTORY' in self._environment:
+            return self._environment['SCRATCH_DIRECTORY']
+
+        return DEFAULT_SCRATCH_DIRECTORY
+
+    @scratch_directory.setter
+    def scratch_directory(self, value):
+        """
+        Set the scratch directory for this clip
+        :param value: Path to the directory
+        """
+        self._environment['SCRATCH_DIRECTORY'] = value
+
     @property
     def behavior(self) -> int:
         """
@@ -450,6 +654,27 @@ class Clip:
         """
         self._clip['behavior'] = int(value)
 
+    @property
+    def blend_mode(self) -> str:
+        """
+        How the clip is blended with the clips beneath it, when composited (see BlendMode)
+        """
+        return self._clip['blend_mode']
+
+    @blend_mode.setter
+    def blend_mode(self, value):
+        """
+        Set the blend mode of the clip
+        :param value: BlendMode (or its value)
+        :raises ValueError: When value is not a valid blend mode
+        """
+        if isinstance(value, Enum):
+            value = value.value
+        if value not in [blend_mode.value for blend_mode in BlendMode]:
+            raise ValueError(f"'{value}' is not a valid blend mode.")
+
+        self._clip['blend_mode'] = value
+
     @property
     def duration(self) -> int:
         """
@@ -512,6 +737,70 @@ class Clip:
         """
         self._clip['fps'] = float(value)
 
+    @property
+    def frame_accurate(self) -> bool:
+        """
+        Should seeking within the clip's file check the timestamp of each frame.
+        This is exact, but will decode up to SEEK_PREROLL seconds of additional footage.
+        """
+        return bool(self._clip['frame_accurate'])
+
+    @frame_accurate.setter
+    def frame_accurate(self, value):
+        """
+        Set the frame_accurate attribute
+        :param value:
+        """
+        self._clip['frame_accurate'] = bool(value)
+
+    @property
+    def frame_store(self) -> str:
+        """
+        How the video frames of this clip are stored in memory (see FrameStore)
+        """
+        return self._clip['frame_store']
+
+    @frame_store.setter
+    def frame_store(self, value):
+        """
+        Set the frame store, converting any existing video frames to it
+
+        :param value: FrameStore (or its value) to use
+        :raises ValueError: When value is not a valid frame store
+        """
+        if isinstance(value, Enum):
+            value = value.value
+        if value not in [frame_store.value for frame_store in FrameStore]:
+            raise ValueError(f"'{value}' is not a valid frame store.")
+
+        self._clip['frame_store'] = value
+
+        # Move the existing frames into the new frame store
+        if self._video['frames_initialized']:
+            self._video['frames'] = self._collect_video_frames(self._video['frames'], len(self._video['frames']))
+
+    @property
+    def lazy(self) -> bool:
+        """
+        Are effects recorded, then applied frame by frame in a single pass when the video frames are needed
+        """
+        return bool(self._clip['lazy'])
+
+    @lazy.setter
+    def lazy(self, value):
+        """
+        Set the lazy attribute
+        :param value:
+        """
+        self._clip['lazy'] = bool(value)
+
+    @property
+    def mask_type(self) -> str:
+        """
+        How the clip's mask is stored (see MaskType)
+        """
+        return self._mask['type']
+
     @property
     def has_audio(self):
         """
@@ -599,6 +888,26 @@ class Clip:
         """
         self._clip['number_frames'] = int(value)
 
+    @property
+    def opacity(self) -> float:
+        """
+        Opacity (0 to 1) of the clip, when composited.
+        A clip blended with BlendMode.MASK, that is not fully opaque, is blended with BlendMode.OVER
+        """
+        return self._clip['opacity']
+
+    @opacity.setter
+    def opacity(self, value):
+        """
+        Set the opacity of the clip
+        :param value: Opacity, from 0 (transparent) to 1 (opaque)
+        :raises ValueError: When value is not between 0 and 1
+        """
+        if not (0 <= float(value) <= 1):
+            raise ValueError(f"opacity ({value}) must be between 0 and 1.")
+
+        self._clip['opacity'] = float(value)
+
     @property
     def position(self) -> tuple:
         """
@@ -754,6 +1063,17 @@ class Clip:
         value = 0 if value is None else value
         self._video['number_frames'] = int(value)
 
+    @property
+    def video_number_frames_method(self) -> str | None:
+        """
+        How the number of frames in the underlying video file was determined (see FrameCount)
+
+        :returns:
+            None - The clip is not associated with a video file
+            str - FrameCount value
+        """
+        return self._video.get('number_frames_method')
+
     @property
     def video_width(self) -> int:
         """
@@ -776,6 +1096,13 @@ class Clip:
         """
         return self._file_path
 
+    @property
+    def video_codec_name(self) -> str | None:
+        """
+        Codec of the video stream in the clip's file, e.g. 'h264'
+        """
+        return self._video['codec_name']
+
     @property
     def video_color_primaries(self):
         """
@@ -854,6 +1181,13 @@ class Clip:
             raise TypeError(f"{type(self).__name__}.video_fps must be an integer or a float")
         self._video['fps'] = fps
 
+    @property
+    def video_pixel_format(self) -> str | None:
+        """
+        Pixel format of the video stream in the clip's file, e.g. 'yuv420p'
+        """
+        return self._video.get('pix_fmt') or self._video['pixel_format']
+
     @property
     def video_resolution(self) -> str:
         """
@@ -863,24 +1197,250 @@ class Clip:
             raise TypeError(f'{type(self).__name__}.video_resolution is None.')
         return self._video['resolution']
 
+    @property
+    def video_stream_parameters(self) -> tuple:
+        """
+        Parameters of the video stream in the clip's file that must match for its packets to be joined with another
+        stream's packets: (codec, pixel format, profile, level, extradata hash, time base)
+        """
+        return (self.video_codec_name, self.video_pixel_format, self._video['profile'], self._video['level'],
+                self._video.get('extradata_hash'), self._video['time_base'])
+
     @property
     def include_audio(self):
         """
-        Should the audio of this clip be included
+        Should the audio of this clip be included, defaults to True if not set
         """
         if self._clip['include_audio'] is None:
-            raise ValueError(f'{type(self).__name__}.include_audio cannot be None.')
+            return True
         return self._clip['include_audio']
 
     ###################
     # Private Methods #
     ###################
     @classmethod
-    def _set_file_information(cls, video_path):
+    def _file_information_cache_key(cls, video_path) -> str:
+        """
+        Key identifying this version of the file in the file information cache
+
+        :param video_path: Path to the video
+        :return key: 'path|size|modification time' of the file
+        """
+        file_stat = os.stat(video_path)
+        return f"{os.path.abspath(video_path)}|{file_stat.st_size}|{file_stat.st_mtime_ns}"
+
+    @staticmethod
+    def _read_file_information_cache(cache_file) -> dict:
+        """
+        Read the file information cached on disk
+
+        :param cache_file: Path to the disk cache
+        :return files: File information keyed by _file_information_cache_key, empty if there is no usable cache
+        """
+        logger = getLogger(__name__)
+
+        # There is no cache on disk to read
+        if not os.path.exists(cache_file):
+            return {}
+
+        try:
+            with open(cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unable to read the metadata cache '{cache_file}' ({e}). It will be ignored.")
+            return {}
+
+        # The cache was written by a version that parsed file information differently
+        if cache.get('version') != METADATA_CACHE_VERSION:
+            return {}
+
+        return cache['files']
+
+    @classmethod
+    def _load_file_information_cache(cls, cache_file):
+        """
+        Load the file information cached on disk into the in-process cache, once per process.
+        Information probed from then on is written back when the process exits (see _save_file_information_cache)
+
+        :param cache_file: Path to the disk cache, None if the disk cache is disabled
+        """
+        # The disk cache is disabled, or has already been loaded
+        if (not cache_file) or (cache_file in cls._file_information_cache_files):
+            return
+
+        cls._file_information_cache_files[cache_file] = set()
+        atexit.register(cls._save_file_information_cache, cache_file)
+        for key, keyword_arguments in cls._read_file_information_cache(cache_file).items():
+            cls._file_information_cache.setdefault(key, keyword_arguments)
+
+    @classmethod
+    def _save_file_information_cache(cls, cache_file):
+        """
+        Merge the file information added by this process into the disk cache.
+        The disk cache is locked while it is read, merged and replaced, so concurrent processes keep each other's
+        updates, and it is replaced atomically, so readers never see a partially written cache.
+
+        :param cache_file: Path to the disk cache
+        """
+        logger = getLogger(__name__)
+
+        # Nothing has been added since the disk cache was loaded
+        added_keys = cls._file_information_cache_files.get(cache_file)
+        if not added_keys:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+            with open(f'{cache_file}.lock', 'w') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                # Merge our files into the cache on disk, replacing older versions of the same files
+                files = cls._read_file_information_cache(cache_file)
+                for key in added_keys & cls._file_information_cache.keys():
+                    file_path = key.rsplit('|', 2)[0]
+                    for stale_key in [k for k in files if k.rsplit('|', 2)[0] == file_path]:
+                        del files[stale_key]
+                    files[key] = cls._file_information_cache[key]
+
+                # Write to a temporary file first, then replace the cache with it
+                file_descriptor, temp_file_path = tempfile.mkstemp(prefix=os.path.basename(cache_file),
+                                                                   suffix='.tmp',
+                                                                   dir=os.path.dirname(os.path.abspath(cache_file)))
+                try:
+                    with os.fdopen(file_descriptor, 'w') as f:
+                        json.dump({'version': METADATA_CACHE_VERSION, 'files': files}, f)
+                    os.replace(temp_file_path, cache_file)
+                except BaseException:
+                    os.remove(temp_file_path)
+                    raise
+        except OSError as e:
+            logger.warning(f"Unable to write the metadata cache '{cache_file}' ({e}).")
+            return
+
+        added_keys.clear()
+
+    @classmethod
+    def _cache_file_information(cls, key, keyword_arguments, cache_file=None):
+        """
+        Cache the file information of a file, in process and (when the process exits) on disk
+
+        :param key: Key of the file (see _file_information_cache_key)
+        :param keyword_arguments: File information of the file
+        :param cache_file: Path to the disk cache, None if the disk cache is disabled
+        """
+        cls._file_information_cache[key] = copy.deepcopy(keyword_arguments)
+        if cache_file in cls._file_information_cache_files:
+            cls._file_information_cache_files[cache_file].add(key)
+
+    @classmethod
+    def _count_video_frames(cls, video_path, keyword_arguments, exact=False):
+        """
+        Determine the number of video frames in a file, whose container does not store it.
+        Unless an exact count is requested, the stream's packets are counted (no decoding needed),
+        falling back to estimating it from the stream's duration and frame rate.
+
+        :param video_path: Path to the video
+        :param keyword_arguments: Keyword arguments found parsing the file's metadata
+        :param exact: Count the frames by decoding the entire video stream
+
+        :returns number_frames, method: Number of video frames, and the FrameCount value of how it was determined
+        """
+        logger = getLogger(__name__)
+
+        # Count the packets in the stream, this only needs the file to be demuxed
+        if not exact:
+            ffprobe_command = [BINARY_FFPROBE,
+                               '-v', 'error',
+                               '-select_streams', 'v:0',
+                               '-count_packets',
+                               '-show_entries',
+                               'stream=nb_read_packets',
+                               '-of', 'csv=p=0',
+                               video_path]
+            logger.debug(f'Calling ffprobe to count packets - "{' '.join(ffprobe_command)}"')
+            completed_process = subprocess.run(ffprobe_command, capture_output=True)
+            try:
+                number_packets = int(completed_process.stdout.strip().split(b',')[0])
+                if number_packets > 0:
+                    return number_packets, FrameCount.PACKETS.value
+            except ValueError:
+                logger.debug(f"Unable to count the packets of '{video_path}'")
+
+            # Estimate the number of frames from the duration and frame rate
+            duration = rational_to_float(keyword_arguments.get('video_duration'))
+            fps = (keyword_arguments.get('video_fps')
+                   or rational_to_float(keyword_arguments.get('video_avg_frame_rate'))
+                   or rational_to_float(keyword_arguments.get('video_r_frame_rate')))
+            if duration and fps:
+                return int(round(duration * float(fps))), FrameCount.ESTIMATE.value
+
+        # Get the number of frames for the video, by decoding all of them
+        ffprobe_command = [BINARY_FFPROBE,
+                           '-v', 'error',
+                           '-select_streams', 'v:0',
+                           '-count_frames',
+                           '-show_entries',
+                           'stream=nb_read_frames',
+                           '-of', 'csv=p=0',
+                           video_path]
+        logger.debug(f'Calling ffprobe to get number frames - "{' '.join(ffprobe_command)}"')
+        completed_process = subprocess.run(ffprobe_command, capture_output=True)
+        return int(completed_process.stdout), FrameCount.DECODE.value
+
+    @classmethod
+    def _set_file_information(cls, video_path, exact_frame_count=False, cache_file=None):
         """
-        Set the video information about video files
+        Set the video information about video files.
+        Information is cached by the file's path, size and modification time, so each file is only probed once.
 
         :param video_path: Path to the video
+        :param exact_frame_count: Decode the video to count its frames, when the container does not store it
+        :param cache_file: Path to the disk cache of file information, None only caches it in this process
+
+        :returns keyword_arguments: Keyword arguments that were found parsing the metadata
+        """
+        logger = getLogger(__name__)
+        key = cls._file_information_cache_key(video_path)
+
+        # Check the disk cache, if we have not seen this file in this process
+        if key not in cls._file_information_cache:
+            cls._load_file_information_cache(cache_file)
+
+        # We have already retrieved the information for this file
+        if key in cls._file_information_cache:
+            logger.debug(f"Using cached file information for '{video_path}'")
+            keyword_arguments = copy.deepcopy(cls._file_information_cache[key])
+
+            # An exact frame count was requested, but we only have an approximate one cached
+            approximate_methods = (FrameCount.PACKETS.value, FrameCount.ESTIMATE.value)
+            if exact_frame_count and (keyword_arguments.get('video_number_frames_method') in approximate_methods):
+                (keyword_arguments['video_number_frames'],
+                 keyword_arguments['video_number_frames_method']) = cls._count_video_frames(video_path,
+                                                                                            keyword_arguments,
+                                                                                            exact=True)
+                cls._cache_file_information(key, keyword_arguments, cache_file)
+
+            return keyword_arguments
+
+        # Drop any information cached for older versions of this file
+        file_path = key.rsplit('|', 2)[0]
+        for stale_key in [k for k in cls._file_information_cache if k.rsplit('|', 2)[0] == file_path]:
+            del cls._file_information_cache[stale_key]
+
+        # Probe the file, and cache the results
+        keyword_arguments = cls._probe_file_information(video_path, exact_frame_count)
+        cls._cache_file_information(key, keyword_arguments, cache_file)
+
+        return keyword_arguments
+
+    @classmethod
+    def _probe_file_information(cls, video_path, exact_frame_count=False):
+        """
+        Retrieve the video information about video files, via a single ffprobe call
+
+        :param video_path: Path to the video
+        :param exact_frame_count: Decode the video to count its frames, when the container does not store it
 
         :returns keyword_arguments: Keyword arguments that were found parsing the metadata
         """
@@ -890,155 +1450,277 @@ class Clip:
         # Initialize the dictionary of values
         keyword_arguments = {}
 
-        # Call ffprobe to get information about the file
-        logger.debug(f"Retrieving data from ffprobe")
-        ffprobe = FFmpeg(executable="ffprobe").input(
-            video_path,
-            print_format="json",  # ffprobe will output the results in JSON format
-            show_streams=None,
-        )
+        # Call ffprobe once, to get information about the container and its streams
+        ffprobe_command = [BINARY_FFPROBE,
+                           '-v', 'error',
+                           '-print_format', 'json',          # ffprobe will output the results in JSON format
+                           '-show_format',
+                           '-show_streams',
+                           '-show_data_hash', 'CRC32',       # Hash of each stream's extradata (e.g. h264 SPS / PPS)
+                           video_path]
+        logger.debug(f'Calling ffprobe to get file information - "{' '.join(ffprobe_command)}"')
+        completed_process = subprocess.run(ffprobe_command, capture_output=True)
+        if completed_process.returncode:
+            raise IOError(f"ffprobe was unable to read '{video_path}': {completed_process.stderr.decode('utf8')}")
+        media = json.loads(completed_process.stdout)
 
-        # Build the keyword arguments dictionary
+        # Build the keyword arguments dictionary from the first stream of each type
         ignore_keys = ['index', 'codec_type', 'codec_tag', 'tags']
-        media = json.loads(ffprobe.execute())
-        for stream in media['streams']:
+        codec_types = set()
+        for stream in media.get('streams', []):
+            if stream.get('codec_type') in codec_types:
+                continue
+            codec_types.add(stream.get('codec_type'))
+
             for key, value in stream.items():
                 if key not in ignore_keys:
                     new_key = f"{stream['codec_type']}_{key}"
                     keyword_arguments[new_key] = value
 
-        # Call ffmpeg to get additional information about the file
-        ffmpeg_info_command = [BINARY_FFMPEG, "-hide_banner", "-i", video_path]
-        logger.debug(f'Calling ffmpeg "{' '.join(ffmpeg_info_command)}"')
-        completed_process = subprocess.run(ffmpeg_info_command, capture_output=True)
-        for line in completed_process.stderr.splitlines()[1:]:
-            if b'Duration: ' in line:
-                duration, start, bit_rate = line.split(b',')
-
-                # Process video start
-                keyword_arguments['video_start'] = float(start.split(b':')[1])
-
-                # Process video bit rate
-                keyword_arguments['video_bit_rate'] = bit_rate.split(b': ')[1].decode('utf8')
-            elif b'Stream #0:0(und): Video' in line:
-                # Set the video_fps attribute
-                value_end = line.find(b' fps')
-                value_start = line[:value_end].rfind(b', ')
-                keyword_arguments['video_fps'] = float(line[value_start + 2:value_end])
-
-                # Set the video_tbr attribute
-                value_end = line.find(b' tbr,')
-                value_start = line[:value_end].rfind(b', ')
-                keyword_arguments['video_tbr'] = float(line[value_start + 2:value_end])
-            elif (b'Stream #0' in line) and (b'Audio:' in line):
-                pass
+        # Frame rates are rationals (e.g. '30000/1001'), fps is the average frame rate, tbr the base frame rate
+        if 'video_codec_name' in keyword_arguments:
+            video_tbr = rational_to_float(keyword_arguments.get('video_r_frame_rate'))
+            video_fps = rational_to_float(keyword_arguments.get('video_avg_frame_rate')) or video_tbr
+            if video_fps:
+                keyword_arguments['video_fps'] = video_fps
+            if video_tbr:
+                keyword_arguments['video_tbr'] = video_tbr
+
+        # Fill in what the streams did not provide, from the container
+        media_format = media.get('format', {})
+        if 'start_time' in media_format:
+            keyword_arguments['video_start'] = float(media_format['start_time'])
+        if ('bit_rate' in media_format) and ('video_bit_rate' not in keyword_arguments):
+            keyword_arguments['video_bit_rate'] = media_format['bit_rate']
+        for codec_type in codec_types:
+            if ('duration' in media_format) and (f'{codec_type}_duration' not in keyword_arguments):
+                keyword_arguments[f'{codec_type}_duration'] = media_format['duration']
 
         # Check that we have the video number of frames, if we have it, we are done
         if 'video_nb_frames' in keyword_arguments:
             keyword_arguments['video_number_frames'] = int(keyword_arguments['video_nb_frames'])
+            keyword_arguments['video_number_frames_method'] = FrameCount.CONTAINER.value
             del keyword_arguments['video_nb_frames']
             return keyword_arguments
 
+        # The file has no video stream, so there are no frames to count
+        if 'video_codec_name' not in keyword_arguments:
+            return keyword_arguments
+
         # Get the number of frames for the video
-        ffprobe_command = [BINARY_FFPROBE,
-                           '-v', 'error',
-                           '-select_streams', 'v:0',
-                           '-count_frames',
-                           '-show_entries',
-                           'stream=nb_read_frames',
-                           '-of', 'csv=p=0',
-                           video_path]
-        logger.debug(f'Calling ffprobe to get number frames - "{' '.join(ffprobe_command)}"')
-        completed_process = subprocess.run(ffprobe_command, capture_output=True)
-        keyword_arguments['video_number_frames'] = int(completed_process.stdout)
+        (keyword_arguments['video_number_frames'],
+         keyword_arguments['video_number_frames_method']) = cls._count_video_frames(video_path,
+                                                                                    keyword_arguments,
+                                                                                    exact=exact_frame_count)
+        logger.debug(f"{keyword_arguments['video_number_frames']} video frames "
+                     f"({keyword_arguments['video_number_frames_method']}) in '{video_path}'")
         return keyword_arguments
 
     @staticmethod
-    def _stipple_frame(pil_image, threshold:int):
+    def _bilevel_frame(frame):
         """
-        Pass Pillow Image in to allow for a pixel by pixel search and
-		remove considerably whiter pixels based on our algorithm for stippling
+        Convert a single frame to bilevel (black and white)
 
-        :param pil_image: PIL Image of the frame to be stippled
-        :param threshold: Stipple threshold
+        :param frame: Frame to convert
+        :return altered_frame: rgb24 frame
+        """
+        image = np.array(Image.fromarray(frame).convert(ImageModes.BLACK_AND_WHITE.value))
+        return np.stack((image, image, image), axis=2).astype('uint8')
+
+    @staticmethod
+    def _compact_mask_frame(mask_frame):
+        """
+        Reduce a mask frame to a single channel, a bitmap (bool) or an alpha plane (uint8)
+
+        :param mask_frame: (height, width) or (height, width, components) mask frame
+        :return mask_frame: (height, width, 1) mask frame
+        """
+        mask_frame = np.asarray(mask_frame)
+        if mask_frame.ndim == 2:
+            mask_frame = mask_frame[..., np.newaxis]
+
+        # Alpha planes are kept as they are, anything else is visible wherever it is set
+        mask_frame = mask_frame[..., :1]
+        if mask_frame.dtype != np.uint8:
+            mask_frame = mask_frame.astype(bool)
+
+        return mask_frame
+
+    @staticmethod
+    def _is_opaque_mask_frame(mask_frame) -> bool:
+        """
+        Is every pixel of a (compacted) mask frame fully visible
+
+        :param mask_frame: Bitmap (bool) or alpha plane (uint8) mask frame
+        :return: True if the mask frame hides nothing
+        """
+        return bool(mask_frame.all()) if mask_frame.dtype == bool else bool(mask_frame.min() == 255)
+
+    @staticmethod
+    def _deduplicate_frames(video_frames) -> tuple:
+        """
+        Find the distinct frame objects within the frames. Still clips (e.g. ColorClip, TextClip, ChessClip) repeat
+        the same frame object for as long as it is shown, so effects need only be applied to each distinct frame once
+
+        :param video_frames: Iterable of frames
+        :return unique_frames, frame_indexes: Distinct frames, in the order they first appear,
+                                              and for each frame the index of its distinct frame
+        """
+        # Every distinct frame is kept in unique_frames, so their ids can not be reused by other frames
+        unique_indexes = {}
+        unique_frames = []
+        frame_indexes = []
+        for frame in video_frames:
+            unique_index = unique_indexes.setdefault(id(frame), len(unique_frames))
+            if unique_index == len(unique_frames):
+                unique_frames.append(frame)
+            frame_indexes.append(unique_index)
+
+        return unique_frames, frame_indexes
+
+    @staticmethod
+    def _grayscale_frame(frame):
+        """
+        Convert a single frame to grayscale
+
+        :param frame: Frame to convert
+        :return altered_frame: rgb24 frame
+        """
+        image = np.array(Image.fromarray(frame).convert(ImageModes.GRAYSCALE.value))
+        return np.stack((image, image, image), axis=2).astype('uint8')
+
+    @staticmethod
+    def _lookup_table_frames(lookup_table, frames):
+        """
+        Map every value of the frame(s) through a lookup table
+
+        :param lookup_table: (components, 256) uint8 array, a 256 entry table for each component
+        :param frames: Frame (height, width, components) or a stack of frames (N, height, width, components)
+
+        :return altered_frames: uint8 frame(s), the same shape as frames
+        """
+        # Every component shares the same table, so map all the values at once
+        if (lookup_table == lookup_table[0]).all():
+            return np.take(lookup_table[0], frames)
+
+        # Map each component through its own table
+        altered_frames = np.empty(frames.shape, dtype='uint8')
+        for component in range(frames.shape[-1]):
+            np.take(lookup_table[component], frames[..., component], out=altered_frames[..., component])
+
+        return altered_frames
+
+    @staticmethod
+    def _painting_frame(frame, saturation:float, black:float):
+        """
+        Transform a single frame into a sort of painting
+
+        :param frame: Frame to transform
+        :param saturation: Saturation multiplier
+        :param black: Amount the edges are darkened by
+        :return altered_frame: Painted frame
+        """
+        # Convert frame into a PIL Image
+        image = Image.fromarray(frame)
+        image = image.filter(ImageFilter.EDGE_ENHANCE_MORE)
+
+        # Convert the image to grayscale
+        grayscale_image = image.convert("L")
+
+        # Find the image edges
+        edges_image = grayscale_image.filter(ImageFilter.FIND_EDGES)
+
+        # Convert the edges image to a numpy array
+        edges = np.array(edges_image)
+
+        # Create the darkening effect
+        darkening = black * (255 * np.dstack(3 * [edges]))
+
+        # Apply the painting effect
+        painting = saturation * np.array(image) - darkening
+
+        # Clip the pixel values to the valid range of 0-255
+        painting = np.maximum(0, np.minimum(255, painting))
+
+        # Convert the pixel values to unsigned 8-bit integers
+        return painting.astype("uint8")
+
+    @staticmethod
+    def _pixelate_frame(frame, pixel_size:int, size:tuple):
+        """
+        Pixelate a single frame
 
-        :return stippled_frame: Frame with the stipple effect applied
+        :param frame: Frame to pixelate
+        :param pixel_size: Size the frame is reduced to, before being scaled back up
+        :param size: (width, height) of the pixelated frame
+        :return altered_frame: Pixelated frame
         """
-        # Convert the image to gray scale
-        pil_image = pil_image.convert('L')
+        image = Image.fromarray(frame)
+
+        # Resize smoothly down
+        image_small = image.resize((pixel_size, pixel_size), resample=Image.Resampling.BILINEAR)
 
-        # Threshold code
-        # Initialize pixel values
-        pixel_values = []
-        for x in range(pil_image.size[0]):
-            col_values = []
-            for y in range(pil_image.size[1]):
-                col_values.append(255)
-            pixel_values.append(col_values)
+        # Scale back up using NEAREST to original size
+        return np.array(image_small.resize(size, Image.Resampling.NEAREST))
 
-        # column search
-        prev_y_pixel = 0
-        prev_x_pixel = 0
-        for x in range(pil_image.size[0]):
-            for y in range(pil_image.size[1]):
+    @staticmethod
+    def _resize_frame(frame, size:tuple, resample):
+        """
+        Resize a single frame
 
-                if y == 0:
-                    prev_y_pixel = pil_image.getpixel((x, y))
-                    continue
+        :param frame: Frame to resize
+        :param size: (width, height) to resize to
+        :param resample: Resampling method to use
+        :return altered_frame: Resized frame
+        """
+        return np.array(Image.fromarray(frame).resize(size, resample)).astype('uint8')
 
-                difference = abs(pil_image.getpixel((x, y)) - prev_y_pixel)
-                prev_y_pixel = pil_image.getpixel((x, y))
+    @staticmethod
+    def _rotate_frame(frame, angle:float):
+        """
+        Rotate a single frame around its center
 
-                if difference >= threshold:
-                    pixel_values[x][y] = 0
+        :param frame: Frame to rotate
+        :param angle: Angle in degrees counter-clockwise
+        :return altered_frame: Rotated frame
+        """
+        return np.array(Image.fromarray(frame).rotate(angle))
 
-        # row search
-        for y in range(pil_image.size[1]):
-            for x in range(pil_image.size[0]):
+    @staticmethod
+    def _stipple_frame(frame, threshold:int, seed=None):
+        """
+        Stipple a single frame. Edges are found where neighbouring pixels differ by at least the threshold,
+        then edge points away from the border of the frame are randomly removed (9 in 10 of them).
 
-                if x == 0:
-                    prev_x_pixel = pil_image.getpixel((x, y))
-                    continue
+        :param frame: Frame (height, width, components) to be stippled
+        :param threshold: Stipple threshold
+        :param seed: Seed for the random removal of edge points, None will use fresh entropy
 
-                difference = abs(pil_image.getpixel((x, y)) - prev_x_pixel)
-                prev_x_pixel = pil_image.getpixel((x, y))
+        :return stippled_frame: rgb24 frame with the stipple effect applied
+        """
+        # Convert the frame to gray scale
+        gray = convert_rgb24_to_gray(frame[..., :3])[..., 0]
+        height, width = gray.shape
 
-                if difference >= threshold:
-                    pixel_values[x][y] = 0
+        # Find the edges, where a pixel differs from the pixel above or to the left of it by at least the threshold.
+        # The differences are taken as max - min, which can not overflow uint8
+        edges = np.zeros((height, width), dtype=bool)
+        edges[1:, :] = (np.maximum(gray[1:], gray[:-1]) - np.minimum(gray[1:], gray[:-1])) >= threshold
+        edges[:, 1:] |= (np.maximum(gray[:, 1:], gray[:, :-1]) - np.minimum(gray[:, 1:], gray[:, :-1])) >= threshold
 
+        # Edge points at least `length` pixels from the border of the frame are randomly removed. The more of the
+        # surrounding points are white the less likely removal is meant to be, but each of those odds is below the
+        # final 9 in 10 chance, which applies whatever the surroundings, so no neighbourhood sums are needed.
+        # Random values are only drawn for the edge points
         length = 2
-        total = length * length * 255
-
-        # Remove points based on surrounding area
-
-        for x in range(length, pil_image.size[0] - length):
-            for y in range(length, pil_image.size[1] - length):
-                if pixel_values[x][y] == 0:
-                    random = randint(1, 10)
-                    pixel_total = 0
-                    for a in range(x - length, x + length):
-                        for b in range(y - length, y + length):
-                            pixel_total += pixel_values[a][b]
-                    # More surrounding black points means greater probability of removal of that point
-                    if (pixel_total > total) and random > 8:
-                        pixel_values[x][y] = 255
-                    elif (pixel_total > int(total * 3 / 4)) and random > 6:
-                        pixel_values[x][y] = 255
-                    elif (pixel_total > int(total / 2)) and random > 4:
-                        pixel_values[x][y] = 255
-                    elif (pixel_total > int(total / 4)) and random > 2:
-                        pixel_values[x][y] = 255
-                    elif (pixel_total >= 0) and (random > 1):
-                        pixel_values[x][y] = 255
-
-        for x in range(pil_image.size[0]):
-            for y in range(pil_image.size[1]):
-                pil_image.putpixel((x, y), pixel_values[x][y])
-
-        # Convert image to rgb
-        pil_image = pil_image.convert("RGB")
-
-        return pil_image
+        inside_edges = edges[length:height - length, length:width - length]
+        random = np.random.default_rng(seed).integers(1, 11, size=int(np.count_nonzero(inside_edges)), dtype='uint8')
+        inside_edges[inside_edges] = random == 1
+
+        # White image, with black points on the remaining edges, as rgb
+        stippled = np.logical_not(edges, out=edges).view('uint8')
+        np.multiply(stippled, np.uint8(255), out=stippled)
+        return np.repeat(stippled[..., np.newaxis], 3, axis=2)
 
     def _read_audio(self,
                     file_path=None,
@@ -1067,7 +1749,7 @@ class Clip:
 
         # return completed_process.stdout
         dt = {1: 'int16', 2: 'int16', 4: 'int32'}[audio_channels]
-        return np.fromstring(completed_process.stdout, dtype=dt).reshape(-1, audio_channels)
+        return np.frombuffer(completed_process.stdout, dtype=dt).reshape(-1, audio_channels)
 
     def _write_audio(self,
                      file_path=None,
@@ -1081,34 +1763,468 @@ class Clip:
         """
         logger = getLogger(__name__)
 
-        audio_data = self.get_audio_frames()
+        audio_data = self.get_audio_frames()
+
+        # FFMPEG Command to write audio to a file
+        audio_codec = 'pcm_u8' if self.audio_channels == 1 else 'pcm_s%dle' % (8 * self.audio_channels)
+        audio_file_format = 's8' if self.audio_channels == 1 else 's%dle' % (8 * self.audio_channels)
+
+        ffmpeg_command = [
+            self.ffmpeg_binary, '-y',
+            '-loglevel', ffmpeg_log_level,                          # Set ffmpeg's log level accordingly
+            "-f", audio_file_format,
+            "-acodec", audio_codec,
+            '-ar', "%d" % self.audio_sample_rate,
+            '-ac', "%d" % self.audio_channels,
+            '-i', '-',
+            file_path]
+
+        # Log the ffmpeg call we will make
+        logger.debug(f"Calling ffmpeg to write audio \"{' '.join(ffmpeg_command)}\"")
+
+        # Write all the data (via ffmpeg) to the temp file
+        process = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, bufsize=10 ** 8)
+        logger.debug( f'Writing {audio_data.shape[0]} audio frames, {audio_data.shape[1]} channels. '
+                      f'({type(audio_data).__name__}, {audio_data.dtype})')
+
+        # Write the audio data to stdin
+        process.stdin.write(audio_data.tobytes())
+        process.stdin.close()
+        process.wait()
+
+    @staticmethod
+    def _write_pipe(stream, frames):
+        """
+        Write raw frames (video frames, or a single array of audio frames) to a pipe read by ffmpeg,
+        then close the pipe. Meant to be run in its own thread.
+
+        :param stream: Binary stream of the pipe's write end
+        :param frames: Iterable of numpy arrays to write
+        """
+        logger = getLogger(__name__)
+        try:
+            write_frames(stream, frames, WRITER_QUEUE_SIZE)
+        except OSError as e:
+            logger.warning(f"Unable to write to ffmpeg ({e})")
+        finally:
+            stream.close()
+
+    def _write_video_segments(self, input_command, output_options, segments:int, segment_directory, extension):
+        """
+        Encode the clip's video frames as separate segments, in parallel ffmpeg processes.
+        Each segment is a separate encode, so every segment starts on a keyframe and they can be concatenated
+        without re-encoding. Every segment reads its own range of frames (see _iter_video_segment_frames), split at
+        the source's keyframes when read from a file, and is fed by its own thread. If any segment fails,
+        every encoder is stopped and the segment directory is removed.
+
+        :param input_command: ffmpeg command, up to and including the raw video input from stdin
+        :param output_options: ffmpeg options for encoding the video
+        :param segments: Number of segments to split the frames into
+        :param segment_directory: Directory the segments are written to
+        :param extension: File extension (container) of the segments
+        :raises IOError: When ffmpeg failed to encode a segment
+        :return segment_paths: Paths to the segments, in order
+        """
+        logger = getLogger(__name__)
+
+        # Split the frames into contiguous ranges of (nearly) equal length
+        if self._video['frames_initialized']:
+            number_frames = len(self._video['frames'])
+        else:
+            number_frames = self.end_frame - self.start_frame
+        segments = max(1, min(int(segments), number_frames))
+        boundaries = [round(number_frames * segment_index / segments) for segment_index in range(segments + 1)]
+
+        # Frames read from a file are split at the keyframes nearest those boundaries, so each segment's decoder
+        # seeks straight to the start of its range
+        if (segments > 1) and self.file_path and not (self._video['frames_initialized'] or self._video['get_frame']):
+            try:
+                video_start = float(self._video['start_time'] or 0)
+                keyframe_indexes = {round((keyframe_time - video_start - self.start_time) * self.fps)
+                                    for keyframe_time in self.get_video_keyframe_times()}
+            except IOError as e:
+                logger.warning(f'Unable to split the segments at keyframes ({e})')
+                keyframe_indexes = set()
+            keyframe_indexes = [frame_index for frame_index in keyframe_indexes if 0 < frame_index < number_frames]
+            if keyframe_indexes:
+                boundaries = sorted({0, number_frames} | {min(keyframe_indexes, key=lambda index: abs(index - boundary))
+                                                         for boundary in boundaries[1:-1]})
+
+        # Start an encoder per segment, each fed its own range of frames by its own thread
+        encoders = []
+        try:
+            for segment_index, (first_frame, last_frame) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+                segment_path = os.path.join(segment_directory, f'segment_{segment_index:04d}.{extension}')
+                command = input_command + ['-an'] + output_options + [segment_path]
+                logger.debug(f"Calling ffmpeg to write segment {segment_index} (frames {first_frame} to "
+                             f"{last_frame}) \"{' '.join(command)}\"")
+                process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE, bufsize=0)
+                writer = Thread(target=self._write_pipe,
+                                args=(process.stdin, self._iter_video_segment_frames(first_frame, last_frame)),
+                                name=f'write_segment_{segment_index}', daemon=True)
+                encoders.append((segment_path, process, writer))
+                writer.start()
+
+            # Wait for every segment to be encoded
+            for segment_path, process, writer in encoders:
+                process.wait()
+                writer.join()
+                if process.returncode:
+                    raise IOError(f"ffmpeg failed to encode the segment '{segment_path}'")
+        except BaseException:
+            # Stop every encoder (which stops the threads feeding them), and remove the segments they wrote
+            for segment_path, process, writer in encoders:
+                process.kill()
+                process.wait()
+            for segment_path, process, writer in encoders:
+                if writer.is_alive():
+                    writer.join()
+            shutil.rmtree(segment_directory, ignore_errors=True)
+            raise
+
+        return [segment_path for segment_path, _, _ in encoders]
+
+    def _collect_video_frames(self, video_frames, number_frames=None):
+        """
+        Gather video frames into this clip's frame store
+
+        :param video_frames: Iterable of video frames
+        :param number_frames: Expected number of video frames, used to preallocate the array frame store
+
+        :return video_frames: List of frames, or an (N, height, width, components) array, per clip.frame_store
+        """
+        # Frames are stored as a list of frames
+        if self.frame_store == FrameStore.LIST.value:
+            return video_frames if isinstance(video_frames, list) else list(video_frames)
+
+        # We already have a contiguous array of frames, in the right kind of frame store
+        if isinstance(video_frames, np.ndarray) and (video_frames.ndim == 4):
+            is_memmap = isinstance(video_frames, np.memmap)
+            if (self.frame_store == FrameStore.ARRAY.value) and not is_memmap:
+                return np.ascontiguousarray(video_frames, dtype='uint8')
+            if ((self.frame_store == FrameStore.MEMMAP.value) and is_memmap
+                    and video_frames.flags.c_contiguous and (video_frames.dtype == np.uint8)):
+                return video_frames
+            if ((self.frame_store == FrameStore.SHARED.value) and isinstance(video_frames, SharedFrames)
+                    and (video_frames.shared_memory is not None) and video_frames.flags.c_contiguous):
+                return video_frames
+
+        # Get the first frame, to know the shape of the array we need
+        video_frames = iter(video_frames)
+        first_frame = next(video_frames, None)
+        if first_frame is None:
+            return np.empty((0, self.height, self.width, PIXEL_FORMATS[self.pixel_format]['nb_components']),
+                            dtype='uint8')
+
+        # Copy the frames into a single preallocated array
+        frame_array = self._allocate_video_frames(max(int(number_frames or 1), 1), first_frame.shape)
+        frame_array[0] = first_frame
+        frame_index = 1
+        for frame in video_frames:
+            # We received more frames than expected, so grow the array
+            if frame_index == frame_array.shape[0]:
+                grown_array = self._allocate_video_frames(2 * frame_index, first_frame.shape)
+                grown_array[:frame_index] = frame_array
+                frame_array = grown_array
+
+            frame_array[frame_index] = frame
+            frame_index += 1
+
+        # Drop any frames we allocated, but did not receive
+        return frame_array[:frame_index]
+
+    def _allocate_video_frames(self, number_frames:int, frame_shape:tuple):
+        """
+        Allocate an uninitialized (number_frames, height, width, components) array in this clip's frame store
+
+        :param number_frames: Number of frames to allocate
+        :param frame_shape: (height, width, components) of a single frame
+        :return frame_array: numpy array, numpy memmap for FrameStore.MEMMAP or SharedFrames for FrameStore.SHARED
+        """
+        shape = (number_frames,) + tuple(frame_shape)
+
+        # Frames in shared memory, which worker processes can read and write in place
+        if self.frame_store == FrameStore.SHARED.value:
+            return SharedFrames(shape)
+
+        if self.frame_store != FrameStore.MEMMAP.value:
+            return np.empty(shape, dtype='uint8')
+
+        # Memory map the frames to an anonymous scratch file. The memory map holds its own handle to the file,
+        # so the operating system removes the file once the memory map (and every view of it) is released
+        with tempfile.TemporaryFile(prefix='filmpy_', suffix='.frames', dir=self.scratch_directory) as scratch_file:
+            frame_array = np.memmap(scratch_file, dtype='uint8', mode='w+', shape=shape)
+
+        return frame_array
+
+    def _map_video_frames(self, video_frames, transform):
+        """
+        Apply a transform to every one of the video frames given.
+        When the frames are stored as an array, the transform is applied to all the frames in a single call.
+
+        :param video_frames: List of frames, or an (N, height, width, components) array of frames
+        :param transform: Function of a frame (height, width, components) or of a stack of frames
+                          (N, height, width, components), returning the altered frame(s)
+        :return altered_frames: The transformed frames, in the same kind of frame store as video_frames
+        """
+        # Memory mapped frames are paged through in chunks that fit within the memory budget.
+        # Intermediate results can be up to 8 bytes per component (float64), hence the factor of 8
+        if isinstance(video_frames, np.memmap):
+            chunk_frames = max(1, self.memory_budget // (8 * video_frames[0].nbytes)) if len(video_frames) else 1
+            altered_frames = None
+            for chunk_start in range(0, len(video_frames), chunk_frames):
+                altered_chunk = transform(video_frames[chunk_start:chunk_start + chunk_frames])
+                if altered_frames is None:
+                    altered_frames = self._allocate_video_frames(len(video_frames), altered_chunk.shape[1:])
+                altered_frames[chunk_start:chunk_start + len(altered_chunk)] = altered_chunk
+            altered_frames = video_frames if altered_frames is None else altered_frames
+        # Apply the transform to all frames at once
+        elif isinstance(video_frames, np.ndarray):
+            altered_frames = transform(video_frames)
+        # Apply the transform frame by frame, once per distinct frame, repeating the altered frame in its place
+        else:
+            unique_frames, frame_indexes = self._deduplicate_frames(video_frames)
+            altered_unique_frames = [transform(frame) for frame in unique_frames]
+            altered_frames = [altered_unique_frames[unique_index] for unique_index in frame_indexes]
+
+        return altered_frames
+
+    def _transform_video_frames(self, transform):
+        """
+        Apply a transform to every video frame of the clip, replacing the clip's video frames.
+        When the clip is lazy, the transform is only recorded, and applied when the frames are next needed.
+
+        :param transform: Function of a frame (height, width, components) or of a stack of frames
+                          (N, height, width, components), returning the altered frame(s)
+        """
+        # Record the transform, to be applied with any others in a single pass over the frames
+        if self.lazy:
+            operations = self._video['operations']
+
+            # Consecutive lookup tables are composed into a single lookup table
+            if (operations and self._is_lookup_table_transform(operations[-1])
+                    and self._is_lookup_table_transform(transform)):
+                previous_table, lookup_table = operations[-1].args[0], transform.args[0]
+                composed_table = np.stack([lookup_table[component][previous_table[component]]
+                                           for component in range(len(lookup_table))])
+                operations[-1] = partial(Clip._lookup_table_frames, composed_table)
+                return
+
+            operations.append(transform)
+            return
+
+        self.set_video_frames(self._map_video_frames(self.get_video_frames(), transform))
+
+    def _execute_video_frames(self, transform, *arguments):
+        """
+        Apply a per-frame transform to every video frame of the clip, replacing the clip's video frames.
+        Frames are spread across the clip's executor (see Clip.executor), in order preserving chunks.
+        When the clip is lazy, the transform is only recorded, and applied when the frames are next needed.
+
+        :param transform: Function of a single frame (and the result of each of the arguments), returning the altered
+                          frame. It needs to be picklable for the process executor, e.g. a staticmethod or a
+                          functools.partial of one. The process executor passes the frames via shared memory
+        :param arguments: Functions of the frame index, each returning an additional argument for the transform
+        """
+        # Record the transform, to be applied with any others in a single pass over the frames
+        if self.lazy:
+            if arguments:
+                transform = partial(Clip._frame_index_transform, transform, arguments)
+            self._video['operations'].append(transform)
+            return
+
+        executor = FrameExecutor(self.executor, self.executor_workers, self.executor_chunk_size)
+        video_frames = self.get_video_frames()
+        arguments = [map(argument, count()) for argument in arguments]
+
+        # Repeated frames are only transformed once, unless the transform is given different arguments per frame
+        if isinstance(video_frames, list) and not arguments:
+            unique_frames, frame_indexes = self._deduplicate_frames(video_frames)
+            if len(unique_frames) < len(video_frames):
+                altered_unique_frames = list(executor.map(transform, unique_frames))
+                self.set_video_frames([altered_unique_frames[unique_index] for unique_index in frame_indexes])
+                return
+
+        # Frames are computed in this process, or by threads sharing its memory
+        if (executor.executor != ExecutorType.PROCESS.value) or (len(video_frames) == 0):
+            self.set_video_frames(self._collect_video_frames(executor.map(transform, video_frames, *arguments),
+                                                             len(video_frames)))
+            return
+
+        # Worker processes read and write frames in shared memory by index, so frames are never pickled.
+        # Frames not already in the shared frame store are copied into shared memory once.
+        if not ((self.frame_store == FrameStore.SHARED.value) and isinstance(video_frames, SharedFrames)):
+            video_frames = SharedFrames.from_frames(video_frames)
+
+        # Transform the first frame here, to find the shape of the altered frames
+        arguments = [iter(frame_arguments) for frame_arguments in arguments]
+        first_frame = transform(video_frames[0], *[next(frame_arguments) for frame_arguments in arguments])
+        altered_frames = SharedFrames((len(video_frames),) + first_frame.shape)
+        altered_frames[0] = first_frame
+
+        # Transform the remaining frames across the worker processes
+        executor.map_into(transform, altered_frames[1:], video_frames[1:], *arguments)
+        self.set_video_frames(altered_frames)
+
+    @staticmethod
+    def _lookup_table(function):
+        """
+        Build a lookup table, by applying a function to every possible pixel value once
+
+        :param function: Function of a (256, 1) array of the pixel values 0-255, returning the altered values,
+                         either for every component (256, 1) or for the red, green and blue components (256, 3)
+        :return lookup_table: (1, 256) or (3, 256) uint8 array, as accepted by Clip.apply_lut()
+        """
+        return np.asarray(function(np.arange(256).reshape(256, 1))).astype('uint8').T
+
+    @staticmethod
+    def _frame_index_transform(transform, arguments, frame, frame_index:int):
+        """
+        Apply a transform to a frame, with additional arguments that depend on the frame's index.
+        Recorded in place of transforms given arguments, by lazy clips (see Clip._execute_video_frames)
+
+        :param transform: Function of a single frame (and the result of each of the arguments)
+        :param arguments: Functions of the frame index, each returning an additional argument for the transform
+        :param frame: Frame to transform
+        :param frame_index: Index of the frame within the clip
+        :return altered_frame: The transformed frame
+        """
+        return transform(frame, *[argument(frame_index) for argument in arguments])
+
+    @staticmethod
+    def _is_frame_index_transform(transform) -> bool:
+        """
+        Is the transform a function of the frame and its index (see Clip._frame_index_transform)
+
+        :param transform: Transform to check
+        """
+        return isinstance(transform, partial) and (transform.func is Clip._frame_index_transform)
+
+    @staticmethod
+    def _is_lookup_table_transform(transform) -> bool:
+        """
+        Is the transform the application of a lookup table (see Clip._lookup_table_frames)
+
+        :param transform: Transform to check
+        """
+        return isinstance(transform, partial) and (transform.func is Clip._lookup_table_frames)
+
+    def _iter_source_video_frames(self, pixel_format=None):
+        """
+        Iterate over the video frames of this clip as they are stored, or as they are read from the clip's source,
+        before any pending effects are applied.
+
+        :param pixel_format: Pixel format of the video frames, If None will use the clip's pixel format
+        :return: Generator of video frames
+        """
+        # We already have frames, so just iterate over them
+        if self._video['frames_initialized'] and ((pixel_format is None) or (pixel_format == self.pixel_format)):
+            yield from self._video['frames']
+            return
+        elif self._video['frames_initialized']:
+            yield from self.get_video_frames(pixel_format)
+            return
+
+        # No frames yet exist, either generate them via the get_video_frame function or stream them from the file
+        if self._video['get_frame']:
+            iter_source_frames = self.iter_video_frames_from_function
+        else:
+            iter_source_frames = partial(self.iter_video_frames_from_file, pixel_format)
+
+        # Determine how many frames we need
+        frames_needed = self.end_frame - self.start_frame
+
+        # We need more frames than we have, and we are to enforce the limit
+        if (frames_needed > self.video_number_frames) and self.behavior == Behavior.ENFORCE_LIMIT.value:
+            raise ValueError(f"Frames needed ({frames_needed}) exceeds the available "
+                             f"number of video frames ({self.video_number_frames})")
 
-        # FFMPEG Command to write audio to a file
-        audio_codec = 'pcm_u8' if self.audio_channels == 1 else 'pcm_s%dle' % (8 * self.audio_channels)
-        audio_file_format = 's8' if self.audio_channels == 1 else 's%dle' % (8 * self.audio_channels)
+        # We need fewer frames than we have, only decode the frames between the clip's start and end times
+        if (frames_needed <= self.video_number_frames) and not self._video['get_frame']:
+            yield from islice(iter_source_frames(start_time=self.start_time, end_time=self.end_time), frames_needed)
+        # We need fewer frames than we have
+        elif frames_needed <= self.video_number_frames:
+            yield from islice(iter_source_frames(), self.start_frame, self.end_frame)
+        # We need to loop over the footage till we have the amount of frames we need
+        elif self.behavior == Behavior.LOOP_FRAMES.value:
+            while frames_needed > 0:
+                loop_frames = min(frames_needed, self.video_number_frames)
+                yield from islice(iter_source_frames(), loop_frames)
+                frames_needed -= loop_frames
+        # Need to pad the footage
+        elif self.behavior == Behavior.PAD.value:
+            source_frame = None
+            for source_frame in iter_source_frames():
+                yield source_frame
 
-        ffmpeg_command = [
-            self.ffmpeg_binary, '-y',
-            '-loglevel', ffmpeg_log_level,                          # Set ffmpeg's log level accordingly
-            "-f", audio_file_format,
-            "-acodec", audio_codec,
-            '-ar', "%d" % self.audio_sample_rate,
-            '-ac', "%d" % self.audio_channels,
-            '-i', '-',
-            file_path]
+            # Pad frames match the source frames, as any pending effects (e.g. crop) are yet to be applied to them
+            if source_frame is not None:
+                frame_shape = source_frame.shape
+            else:
+                frame_shape = (self.video_height, self.video_width,
+                               PIXEL_FORMATS[pixel_format or self.pixel_format]['nb_components'])
+            color = (77, 128, 90, 255)
+            number_pad_frames = frames_needed - self.video_number_frames
+            pad_frame = np.empty(frame_shape, dtype='uint8')
+            pad_frame[:] = color[:frame_shape[-1]] if frame_shape[-1] > 1 else color[0]
+            for _ in range(number_pad_frames):
+                yield pad_frame
 
-        # Log the ffmpeg call we will make
-        logger.debug(f"Calling ffmpeg to write audio \"{' '.join(ffmpeg_command)}\"")
+    def _iter_altered_video_frames(self, source_frames, pixel_format=None, first_frame_index:int=0):
+        """
+        Apply the pending effects (see Clip.lazy) to the clip's source video frames, one frame at a time
 
-        # Write all the data (via ffmpeg) to the temp file
-        process = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, bufsize=10 ** 8)
-        logger.debug( f'Writing {audio_data.shape[0]} audio frames, {audio_data.shape[1]} channels. '
-                      f'({type(audio_data).__name__}, {audio_data.dtype})')
+        :param source_frames: Iterable of source video frames, in the clip's pixel format
+        :param pixel_format: Pixel format of the video frames, If None will use the clip's pixel format
+        :param first_frame_index: Index, within the clip, of the first source frame (for effects using the index)
+        :return: Generator of video frames
+        """
+        operations = list(self._video['operations'])
+
+        # Effects are applied in the clip's pixel format, so find the conversion needed afterwards (if any)
+        conversion = None
+        if pixel_format and (pixel_format != self.pixel_format):
+            conversions = PIXEL_FORMATS[self.pixel_format].get('conversions', {})
+            if pixel_format not in conversions:
+                raise ValueError(f"Converting video frames from '{self.pixel_format}' to '{pixel_format}' "
+                                 f"is not supported.")
+            conversion = conversions[pixel_format]
+
+        # Apply every pending effect to each frame in turn.
+        # A frame repeating the previous frame (e.g. a still image) repeats the previous altered frame,
+        # unless an effect depends on the frame's index
+        frame_index_operations = [self._is_frame_index_transform(operation) for operation in operations]
+        source_frame = altered_frame = None
+        for frame_index, frame in enumerate(source_frames, first_frame_index):
+            if (frame is not source_frame) or any(frame_index_operations):
+                source_frame = frame
+                for operation, is_frame_index_operation in zip(operations, frame_index_operations):
+                    frame = operation(frame, frame_index) if is_frame_index_operation else operation(frame)
+                altered_frame = conversion(frame) if conversion else frame
+
+            yield altered_frame
+
+    def _iter_video_segment_frames(self, first_frame:int, last_frame:int):
+        """
+        Iterate over a range of the clip's video frames, with any pending effects applied, independently of the
+        clip's other ranges so several ranges can be read at once. Frames already read in are sliced, frames from
+        a file are read by seeking ffmpeg to the range, and other sources are read up to the range.
+
+        :param first_frame: Index, within the clip, of the first frame of the range
+        :param last_frame: Index, within the clip, of the frame after the range
+        :return: Generator of video frames
+        """
+        number_frames = last_frame - first_frame
+        if self._video['frames_initialized']:
+            source_frames = self._video['frames'][first_frame:last_frame]
+        elif (not self._video['get_frame']) and ((self.end_frame - self.start_frame) <= self.video_number_frames):
+            source_frames = islice(self.iter_video_frames_from_file(start_time=self.start_time + first_frame / self.fps,
+                                                                    end_time=self.start_time + last_frame / self.fps),
+                                   number_frames)
+        else:
+            source_frames = islice(self._iter_source_video_frames(), first_frame, last_frame)
 
-        # Write the audio data to stdin
-        process.stdin.write(audio_data.tobytes())
-        process.stdin.close()
-        process.wait()
+        yield from self._iter_altered_video_frames(source_frames, first_frame_index=first_frame)
 
     ##################
     # Public Methods #
@@ -1138,15 +2254,10 @@ class Clip:
             logger.warning(f"All addends are 0. No work needed.")
             return self
 
-        # Add colors in each frame
-        altered_frames = []
+        # Add colors in each frame, via a lookup table
         luminance_array = np.array([luminance, luminance, luminance])
         red_addend_array = np.array([red_addend, green_addend, blue_addend])
-        for frame in self.get_video_frames():
-            altered_frames.append((frame + red_addend_array + luminance_array).astype('uint8'))
-
-        # Replace the existing frames
-        self.set_video_frames(altered_frames)
+        self.apply_lut(self._lookup_table(lambda values: (values + red_addend_array + luminance_array).astype('uint8')))
 
         # Return this object to enable method chaining
         return self
@@ -1245,6 +2356,48 @@ class Clip:
         # Return this object to enable method chaining
         return self
 
+    def apply_lut(self, lookup_table):
+        """
+        Map every pixel value of the video through a lookup table.
+        Consecutive lookup tables on a lazy clip are composed, and applied as a single lookup table.
+
+        Affects: Video
+
+        :param lookup_table: 256 entry table applied to every component, or one 256 entry table per component
+                             (e.g. 3x256 for red, green and blue). Components without a table are unchanged.
+        :raises ValueError: When the table has the wrong shape, or values outside of 0-255
+        :return self: Enables method chaining
+        """
+        logger = getLogger(__name__)
+        logger.debug(f'{type(self).__name__}.apply_lut(lookup_table={np.shape(lookup_table)})')
+
+        # A single table, is applied to every component
+        lookup_table = np.asarray(lookup_table)
+        if lookup_table.ndim == 1:
+            lookup_table = lookup_table.reshape(1, -1)
+
+        # Ensure we have a valid lookup table
+        number_components = PIXEL_FORMATS[self.pixel_format]['nb_components']
+        if ((lookup_table.ndim != 2) or (lookup_table.shape[1] != 256)
+                or (lookup_table.shape[0] > number_components)):
+            raise ValueError(f"Lookup table of shape {lookup_table.shape} is not valid, expected (256,) or "
+                             f"(components, 256) with at most {number_components} components.")
+        if (lookup_table.min() < 0) or (lookup_table.max() > 255):
+            raise ValueError(f"Lookup table values must be between 0 and 255.")
+
+        # Expand the table to every component of the clip's pixel format
+        component_tables = np.tile(np.arange(256, dtype='uint8'), (number_components, 1))
+        if lookup_table.shape[0] == 1:
+            component_tables[:] = lookup_table
+        else:
+            component_tables[:lookup_table.shape[0]] = lookup_table
+
+        # Map the frames through the table
+        self._transform_video_frames(partial(Clip._lookup_table_frames, component_tables))
+
+        # Enable method chaining
+        return self
+
     def replace_video(self,
                   start_time,
                   duration,
@@ -1446,14 +2599,8 @@ class Clip:
         :return:
         """
 
-        altered_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).convert(ImageModes.BLACK_AND_WHITE.value)
-            frame = np.stack((np.array(image), np.array(image), np.array(image)), axis=2).astype('uint8')
-            altered_frames.append(frame)
-
-        # Replace the clip frames with the now rotated frames
-        self.set_video_frames(altered_frames)
+        # Convert each frame, replacing the clip frames
+        self._execute_video_frames(Clip._bilevel_frame)
 
         # Return this object to enable method chaining
         return self
@@ -1612,19 +2759,8 @@ class Clip:
         logger = getLogger()
         logger.debug(f"{type(self).__name__}.pixelate(pixel_size={pixel_size})")
 
-        # Pixelate the frames
-        altered_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame)
-
-            # Resize smoothly down
-            image_small = image.resize((pixel_size, pixel_size), resample=Image.Resampling.BILINEAR)
-
-            # Scale back up using NEAREST to original size, and add it to the altered frames
-            altered_frames.append(np.array(image_small.resize(self.size, Image.Resampling.NEAREST)))
-
-        # Update clip frames
-        self.set_video_frames(altered_frames)
+        # Pixelate the frames, and update the clip frames
+        self._execute_video_frames(partial(Clip._pixelate_frame, pixel_size=pixel_size, size=self.size))
 
         # Enable method chaining
         return self
@@ -1683,20 +2819,11 @@ class Clip:
         self.height = bottom_right_y - top_left_y
         self.width = bottom_right_x - top_left_x
 
-        # Get the frames to be processed
-        frames = self.get_video_frames()
-
         # Crop the frames
         logger.debug(f"Cropping image from ({top_left_x},{top_left_y}) to ({bottom_right_x},{bottom_right_y})")
-        cropped_frames = []
-        for frame in frames:
-            cropped_frame = frame[top_left_y:bottom_right_y, top_left_x:bottom_right_x]
-            cropped_frames.append(cropped_frame)
-
-        logger.debug(f"{len(cropped_frames)} frames cropped")
-
-        # Replace the frames with the new frames
-        self.set_video_frames(cropped_frames)
+        self._transform_video_frames(lambda frames: frames[..., top_left_y:bottom_right_y,
+                                                               top_left_x:bottom_right_x, :])
+        logger.debug(f"{self.number_frames} frames cropped")
 
         # Enable method chaining
         return self
@@ -1722,7 +2849,7 @@ class Clip:
         # Alter the video frames accordingly
         if self.has_video:
             # Get the frames
-            frames = self.get_video_frames()
+            frames = list(self.get_video_frames())
 
             # Determine the cut frame indices
             start_index = int(self.fps * start_time)
@@ -1778,19 +2905,15 @@ class Clip:
             logger.warning(f"All divisors, set to 1. No work needed.")
             return self
 
-        if red_divisor or green_divisor or blue_divisor or luminance == 0:
+        if 0 in (red_divisor, green_divisor, blue_divisor, luminance):
             raise ValueError(f"divisor can not be zero.")
 
         # Multiply colors in each frame
         logger.debug(f"Color Divisors : Red x {red_divisor}, Green x {green_divisor}, "
                      f"Blue x {blue_divisor}, Luminance={luminance}")
-        altered_frames = []
         luminance_array = np.array([luminance, luminance, luminance])
-        for frame in self.get_video_frames():
-            altered_frames.append((frame / (red_divisor, green_divisor, blue_divisor) / luminance_array).astype('uint8'))
-
-        # Replace the existing frames
-        self.set_video_frames(altered_frames)
+        divisors = (red_divisor, green_divisor, blue_divisor)
+        self.apply_lut(self._lookup_table(lambda values: (values / divisors / luminance_array).astype('uint8')))
 
         # Return this object to enable method chaining
         return self
@@ -1805,12 +2928,7 @@ class Clip:
 
         # Invert colors of each frame
         logger.debug(f"Inverting colors")
-        altered_frames = []
-        for frame in self.get_video_frames():
-            altered_frames.append((255 - frame).astype('uint8'))
-
-        # Replace the existing frames
-        self.set_video_frames(altered_frames)
+        self.apply_lut(self._lookup_table(lambda values: (255 - values).astype('uint8')))
 
         # Return this object to enable method chaining
         return self
@@ -1831,24 +2949,9 @@ class Clip:
             logger.warning(f"The dimensions {self.size} are already even, no work needed.")
             return self
 
-        # Get the existing frames
-        video_frames = self.get_video_frames()
-
         # Trim 1 pixel from height and/or width as needed
-        altered_frames = []
-        for frame in video_frames:
-            # The height of the frame is odd
-            if frame.shape[0] % 2 == 1:
-                frame = frame[:-1, :, :]
-
-            # The width of the frame is odd
-            if frame.shape[1] % 2 == 1:
-                frame = frame[:,:-1,:]
-
-            altered_frames.append(frame)
-
-        # Replace the existing frames with the newly generated ones
-        self.set_video_frames(altered_frames)
+        self._transform_video_frames(lambda frames: frames[..., :frames.shape[-3] - frames.shape[-3] % 2,
+                                                               :frames.shape[-2] - frames.shape[-2] % 2, :])
 
         # Enable method chaining
         return self
@@ -1896,7 +2999,7 @@ class Clip:
         logger.debug(f"{type(self).__name__}.freeze(time={time},duration={duration})")
 
         # Get the video frames
-        video_frames = self.get_video_frames()
+        video_frames = list(self.get_video_frames())
         logger.debug(f"{len(video_frames)} frames detected")
 
         # Determine where to start the freeze, and for how long
@@ -1949,7 +3052,7 @@ class Clip:
             logger.warning(f'inside and outside provided. Only inside={inside} will be used')
 
         # Get the video frames
-        video_frames = self.get_video_frames()
+        video_frames = list(self.get_video_frames())
         logger.debug(f"{len(video_frames)} frames detected")
 
         # Determine where to start the freeze, and for how long
@@ -1996,12 +3099,7 @@ class Clip:
 
         # Update frames
         logger.info(f"Gamma correcting footage (gamma='{gamma}')")
-        altered_frames = []
-        for frame in self.get_video_frames():
-            new_frame = (255 * (1.0 * frame / 255) ** gamma).astype('uint8')
-            altered_frames.append(new_frame)
-
-        self.set_video_frames(altered_frames)
+        self.apply_lut(self._lookup_table(lambda values: (255 * (1.0 * values / 255) ** gamma).astype('uint8')))
         logger.info(f"Finished gamma correcting footage (gamma='{gamma}')")
 
         # Enable method chaining
@@ -2072,41 +3170,65 @@ class Clip:
 
     def get_mask_frames(self, pixel_format=None):
         """
-        Get the mask frames for this clip
-        :return:
-        """
-
-        # Previously initialized frames have been created, so return them
-        if self._mask['initialized']:
-            return self._mask['frames']
-
-        # Default the pixel format to the clip's pixel_format value
-        if not pixel_format:
-            pixel_format = self.pixel_format
+        Get the stored mask frames for this clip, (height, width, 1) bitmaps (bool) or alpha planes (uint8) which
+        broadcast against frames of any pixel format. Looped mask frames are not repeated for every frame of the clip
+        (see iter_mask_frames), a MaskType.STATIC mask is a single frame and a MaskType.OPAQUE mask is a single
+        read only frame, broadcast from one value
 
-        # Generate mask cell
-
-        # No mask exists, so we need to create one
-        if not self._mask['frames']:
-            number_components = PIXEL_FORMATS[pixel_format]['nb_components']
-            mask_cell = np.tile(True, number_components)
-            self._mask['frames'] = [np.tile(mask_cell, self.width * self.height)
-                                    .reshape(self.height, self.width, number_components)]
+        :param pixel_format: Unused, mask frames have a single channel whatever the pixel format
+        :return mask_frames: List of mask frames
+        """
+        # Nothing is hidden, so no mask frame is stored
+        if self.mask_type == MaskType.OPAQUE.value:
+            return [np.broadcast_to(np.True_, (self.height, self.width, 1))]
 
-        # If mask behavior is to loop, then create all the mask frames we need, and replace the mask frames we had
-        if self._mask['behavior'] == Behavior.LOOP_FRAMES.value:
-            looped_mask_frames = []
-            for frame_index in range(self.number_frames):
-                mask_frame_index = frame_index % len(self._mask['frames'])
-                looped_mask_frames.append(self._mask['frames'][mask_frame_index])
+        return self._mask['frames']
 
-            self._mask['frames'] = looped_mask_frames
+    def get_stream_copy_range(self, include_audio:bool=True):
+        """
+        Determine whether this clip is its file's streams unaltered, so its packets can be copied rather than decoded
+        and re-encoded. That is, a file backed clip with no effects, mask, resizing or frame rate change applied,
+        and either no trim or a trim that starts and ends on keyframes (an early end requires a video without B-frames).
 
-        # Update the mask initialized flag
-        self._mask['initialized'] = True
+        :param include_audio: The clip's audio is also to be copied, so it must not have been read in (and altered)
+        :return range: (start time, end time) to copy, where None is the start / end of the file,
+                       or None when the clip must be re-encoded
+        """
+        logger = getLogger(__name__)
 
-        # Return the mask frames
-        return self._mask['frames']
+        # Only untouched video from a file can be copied
+        if ((not self.file_path) or (not self.has_video) or self._video['get_frame']
+                or self._video['frames_initialized'] or self._video['operations']
+                or (self.mask_type != MaskType.OPAQUE.value)):
+            return None
+
+        # The clip's frames must be the same as the file's frames
+        if ((self.width, self.height) != (self.video_width, self.video_height)) or (self.fps != self.video_fps):
+            return None
+        if include_audio and self.include_audio and self.audio_codec_name and self._audio['frames_initialized']:
+            return None
+
+        # Trims must fall on keyframes, as packets can only be copied from a keyframe onwards
+        half_frame = 0.5 / self.video_fps
+        start_time = self.start_time if self.start_time > half_frame else None
+        end_time = self.end_time if self.end_time < (self.video_end_time - half_frame) else None
+        if self.end_time > (self.video_end_time + half_frame):
+            return None
+
+        # With B-frames, packets are stored out of order, so frames after the end time would be copied too
+        if (end_time is not None) and (self._video.get('has_b_frames') != 0):
+            return None
+        if (start_time is not None) or (end_time is not None):
+            # Keyframe times are timestamps, which start at the video stream's start time rather than at 0
+            video_start = float(self._video['start_time'] or 0)
+            keyframe_times = [keyframe_time - video_start for keyframe_time in self.get_video_keyframe_times()]
+            for trim_time in (start_time, end_time):
+                if (trim_time is not None) and not any(abs(trim_time - keyframe_time) < half_frame
+                                                       for keyframe_time in keyframe_times):
+                    logger.debug(f"{type(self).__name__} trim at {trim_time}s is not on a keyframe")
+                    return None
+
+        return start_time, end_time
 
     def get_video_frames(self, pixel_format=None):
         """
@@ -2118,80 +3240,57 @@ class Clip:
         logger = getLogger(__name__)
         logger.debug(f'{type(self).__name__}.get_video_frames(pixel_format={pixel_format})')
 
+        # Effects that are still pending on the frames
+        operations = self._video['operations']
+
         # We already have frames, and they are already in the right pixel format
-        if self._video['frames_initialized'] and ((pixel_format is None) or (pixel_format == self.pixel_format)):
+        if (self._video['frames_initialized'] and not operations
+                and ((pixel_format is None) or (pixel_format == self.pixel_format))):
             return self._video['frames']
 
-        # We have frames, but they are not in the right pixel format and convert to rgba
-        if self._video['frames_initialized'] and pixel_format == 'rgba' and self.pixel_format == 'rgb24':
-            logger.debug(f'Converting {len(self._video['frames'])} video frames to {pixel_format}')
-            # Create the new frame data
-            new_frames = []
-            for frame in self._video['frames']:
-                new_frame = []
-                flattened_frame = frame.flatten()
-                for i in range(0, len(flattened_frame), 3):
-                    pixel = (flattened_frame[i:i+3][0],flattened_frame[i:i+3][1],flattened_frame[i:i+3][2],1)
-                    new_frame.append(pixel)
-                new_frames.append(numpy.array(new_frame).reshape(self.height, self.width, 4).astype('uint8'))
-
-            return new_frames
-
-        # We have rgba frames but need rgb24 frames
-        if self._video['frames_initialized'] and pixel_format == 'rgb24' and self.pixel_format == 'rgba':
-            logger.debug(f'Converting {len(self._video['frames'])} video frames to {pixel_format}')
-            # Create the new frame data
-            new_frames = []
-            for frame in self._video['frames']:
-                new_frame = []
-                flattened_frame = frame.flatten()
-                for i in range(0, len(flattened_frame), 4):
-                    pixel = (flattened_frame[i:i+4][0],flattened_frame[i:i+4][1],flattened_frame[i:i+4][2])
-                    new_frame.append(pixel)
-                new_frames.append(numpy.array(new_frame).reshape(self.height, self.width, 4).astype('uint8'))
-
-            return new_frames
-
-        # No frames yet exist, and we were given a get_video_frame function
-        if self._video['get_frame']:
-            video_frames = self.get_video_frames_from_function()
-        else:
-            video_frames = self.get_video_frames_from_file(pixel_format)
-
-        # Determine how many frames we need
-        frames_needed = self.end_frame - self.start_frame
-
-        # We need more frames than we have, and we are to enforce the limit
-        if (frames_needed > self.video_number_frames) and self.behavior == Behavior.ENFORCE_LIMIT.value:
-            raise ValueError(f"Frames needed ({frames_needed}) exceeds the available "
-                             f"number of video frames ({self.video_number_frames})")
-
-        # We need fewer frames than we have
-        if frames_needed <= self.video_number_frames:
-            self.set_video_frames(video_frames[self.start_frame:self.end_frame])
-        # We need to loop over the footage till we have the amount of frames we need
-        elif self.behavior == Behavior.LOOP_FRAMES.value:
-            looped_frames = []
-
-            while frames_needed > 0:
-                if frames_needed > self.video_number_frames:
-                    looped_frames.extend(video_frames)
-                    frames_needed -= self.video_number_frames
-                else:
-                    looped_frames.extend(video_frames[0:frames_needed])
-                    frames_needed -= frames_needed
-
-            self.set_video_frames(looped_frames)
-        # Need to pad the footage
-        elif self.behavior == Behavior.PAD.value:
-            color = (77, 128, 90)
-            number_pad_frames = frames_needed - self.video_number_frames
-            pad_frame = (np.tile(color, self.width * self.height)
-                          .reshape(self.height, self.width, 3)
-                          .astype('uint8'))
+        # We have frames, but they are not in the requested pixel format, so convert them
+        if self._video['frames_initialized'] and not operations:
+            conversions = PIXEL_FORMATS[self.pixel_format].get('conversions', {})
+            if pixel_format not in conversions:
+                raise ValueError(f"Converting video frames from '{self.pixel_format}' to '{pixel_format}' "
+                                 f"is not supported.")
 
-            video_frames.extend([pad_frame] * number_pad_frames)
-            self.set_video_frames(video_frames)
+            logger.debug(f'Converting {len(self._video['frames'])} video frames to {pixel_format}')
+            return self._map_video_frames(self._video['frames'], conversions[pixel_format])
+
+        # No frames yet exist (or effects are pending on them), so estimate how much memory they will need
+        number_frames = self.end_frame - self.start_frame
+        number_components = PIXEL_FORMATS[pixel_format or self.pixel_format]['nb_components']
+
+        # Listed frames repeating the previous frame (e.g. a still clip) share it, as do their altered frames,
+        # unless an effect depends on the frame's index
+        number_distinct_frames = number_frames
+        if (self._video['frames_initialized'] and isinstance(self._video['frames'], list)
+                and not any(self._is_frame_index_transform(operation) for operation in operations)):
+            video_frames = self._video['frames']
+            number_distinct_frames = sum(1 for frame_index, frame in enumerate(video_frames)
+                                         if (frame_index == 0) or (frame is not video_frames[frame_index - 1]))
+        frames_size = number_distinct_frames * int(self.width or 0) * int(self.height or 0) * number_components
+
+        # The frames will not fit within our memory budget, so memory map them to disk instead
+        if (frames_size > self.memory_budget) and (self.frame_store != FrameStore.MEMMAP.value):
+            logger.info(f'{type(self).__name__} video frames need {frames_size} bytes, exceeding the memory budget '
+                        f'of {self.memory_budget} bytes. Switching to the {FrameStore.MEMMAP.value} frame store.')
+            self.frame_store = FrameStore.MEMMAP.value
+
+        # Frames read in from their source start at the clip's start time
+        if not self._video['frames_initialized']:
+            self._video['frames_start_time'] = self.start_time
+
+        # Read the frames in from their source, applying any pending effects in a single pass.
+        # Pending effects are applied in the clip's own pixel format, then converted as requested.
+        if operations:
+            logger.debug(f'Applying {len(operations)} pending effects to the video frames')
+            self.set_video_frames(self._collect_video_frames(self.iter_video_frames(), number_frames))
+            self._video['operations'] = []
+            return self.get_video_frames(pixel_format)
+
+        self.set_video_frames(self._collect_video_frames(self.iter_video_frames(pixel_format), number_frames))
 
         # Indicate the frames have been initialized
         self._video['frames_initialized'] = True
@@ -2209,23 +3308,116 @@ class Clip:
         logger.debug(f'{type(self).__name__}.get_video_frames_from_function()')
 
         # Generate the frames for the clip
-        video_frames = []
-        video_get_frame = self._video['get_frame']
-        for frame_index in range(self.end_frame):
-            frame_time = frame_index / self.fps
-            frame, frame_size = video_get_frame(frame_index, frame_time)
-            video_frames.append(frame)
-
+        video_frames = list(self.iter_video_frames_from_function())
         logger.debug(f'{len(video_frames)} frames generated.')
 
         # Return the newly created video frames
         return video_frames
 
+    def get_video_frames_from_file(self, pixel_format=None, start_time=None, end_time=None):
+        """
+        Get the video frames, decoded straight into the clip's frame store
+
+        :param pixel_format: Pixel format to read the frames in, If None will use the clip's pixel format
+        :param start_time: Time, in seconds, of the first frame to read. If None, reads from the start of the file
+        :param end_time: Time, in seconds, to stop reading frames at. If None, reads to the end of the file
+        :return: Frames, as a list or array depending on the clip's frame store
+        """
+        # Estimate the number of frames, so array frame stores can be preallocated
+        number_frames = int(((end_time or self.video_end_time) - float(start_time or 0)) * self.video_fps)
+
+        return self._collect_video_frames(self.iter_video_frames_from_file(pixel_format,
+                                                                           start_time=start_time,
+                                                                           end_time=end_time),
+                                          number_frames)
+
+    def get_video_keyframe_times(self) -> list:
+        """
+        Get the times of the keyframes in the clip's video file, via ffprobe
+
+        :raises IOError: When ffprobe was unable to read the file
+        :return keyframe_times: Sorted list of keyframe timestamps, in seconds (from the video stream's start time, not 0)
+        """
+        logger = getLogger(__name__)
+
+        # Only keyframes are decoded, so this is much faster than reading every frame
+        ffprobe_command = [self.binary_ffprobe,
+                           '-v', 'error',
+                           '-select_streams', 'v:0',
+                           '-skip_frame', 'nokey',
+                           '-show_entries', 'frame=best_effort_timestamp_time',
+                           '-of', 'csv=p=0',
+                           self.file_path]
+        logger.debug(f'Calling ffprobe to get keyframe times - "{' '.join(ffprobe_command)}"')
+        completed_process = subprocess.run(ffprobe_command, capture_output=True)
+        if completed_process.returncode:
+            raise IOError(f"ffprobe was unable to read '{self.file_path}': "
+                          f"{completed_process.stderr.decode('utf8')}")
+
+        return sorted(float(line.strip(',')) for line in completed_process.stdout.decode('utf8').split()
+                      if line.strip(',') not in ('', 'N/A'))
+
+    def iter_mask_frames(self, pixel_format=None):
+        """
+        Iterate over the mask frames of this clip, one frame at a time, repeating the stored mask frames
+        (see get_mask_frames) rather than creating a mask frame for each frame of the clip
+
+        :param pixel_format: Unused, mask frames have a single channel whatever the pixel format
+        :return: Generator of (height, width, 1) mask frames
+        """
+        mask_frames = self.get_mask_frames()
+
+        # If mask behavior is to loop (or there is no mask), repeat the mask frames for every frame of the clip
+        if (self._mask['behavior'] == Behavior.LOOP_FRAMES.value) or (self.mask_type == MaskType.OPAQUE.value):
+            for frame_index in range(self.number_frames):
+                yield mask_frames[frame_index % len(mask_frames)]
+        else:
+            yield from mask_frames
+
+    def iter_video_frames(self, pixel_format=None):
+        """
+        Iterate over the video frames of this clip, one frame at a time.
+        Frames that have not been read in yet are streamed from their source, rather than being held in memory.
+        Any pending effects (see Clip.lazy) are applied to each frame as it passes through.
+
+        :param pixel_format: Pixel format of the video frames, If None will use the clip's pixel format
+        :return: Generator of video frames
+        """
+        # Debug message for the method call itself
+        logger = getLogger(__name__)
+        logger.debug(f'{type(self).__name__}.iter_video_frames(pixel_format={pixel_format})')
+
+        # No effects are pending, so the frames come straight from their source
+        operations = list(self._video['operations'])
+        if not operations:
+            yield from self._iter_source_video_frames(pixel_format)
+            return
+
+        # Apply the pending effects to each frame as it is read
+        yield from self._iter_altered_video_frames(self._iter_source_video_frames(), pixel_format)
+
+    def iter_video_frames_from_function(self):
+        """
+        Iterate over the video frames generated by the get_video_frame function supplied
+
+        :return: Generator of video frames
+        """
+        video_get_frame = self._video['get_frame']
+        for frame_index in range(self.end_frame):
+            frame_time = frame_index / self.fps
+            frame, frame_size = video_get_frame(frame_index, frame_time)
+            yield frame
 
-    def get_video_frames_from_file(self, pixel_format=None):
+    def iter_video_frames_from_file(self, pixel_format=None, start_time=None, end_time=None, frame_accurate=None):
         """
-        Get the video frames
-        :return: List of frames
+        Iterate over the video frames of the file, reading a single frame at a time from ffmpeg's output.
+        When given a start and/or end time, ffmpeg seeks to them, so only the frames in between are decoded.
+
+        :param pixel_format: Pixel format to read the frames in, If None will use the clip's pixel format
+        :param start_time: Time, in seconds, of the first frame to read. If None, reads from the start of the file
+        :param end_time: Time, in seconds, to stop reading frames at. If None, reads to the end of the file
+        :param frame_accurate: Select frames by their timestamps. If None will use the clip's frame_accurate value
+        :return: Generator of video frames
         """
         logger = getLogger(__name__)
 
@@ -2233,32 +3425,62 @@ class Clip:
         pixel_format = pixel_format if pixel_format else self.pixel_format
         pixel_format_info = PIXEL_FORMATS[pixel_format]
 
+        # Default frame accuracy to the clip's setting
+        frame_accurate = self.frame_accurate if frame_accurate is None else frame_accurate
+        start_time = float(start_time) if start_time else 0.0
+
+        # Build the input options for ffmpeg
+        command = [self.ffmpeg_binary]
+        if frame_accurate and (start_time or end_time):
+            # Seek to shortly before the start time, keeping the original timestamps,
+            # then select the frames by their timestamps via the trim filter
+            half_frame = 0.5 / self.video_fps
+            video_start = float(self._video['start_time'] or 0)
+            trim = f"trim=start={video_start + start_time - half_frame:.6f}"
+            if end_time:
+                trim += f":end={video_start + float(end_time) - half_frame:.6f}"
+
+            command.extend(['-ss', '%f' % max(0.0, start_time - SEEK_PREROLL),
+                            '-noaccurate_seek',
+                            '-copyts',
+                            '-i', self.file_path,
+                            '-vf', trim,
+                            '-fps_mode', 'passthrough'])
+        else:
+            # Seek to the start time (if any) and only read for the duration requested
+            if start_time:
+                command.extend(['-ss', '%f' % start_time])
+            if end_time:
+                command.extend(['-t', '%f' % (float(end_time) - start_time)])
+            command.extend(['-i', self.file_path])
+
         # Call ffmpeg and pipe it's output
-        command = [self.ffmpeg_binary,
-                   '-i', self.file_path,                        # File we will load video frames from
+        command.extend([
                    '-f', 'image2pipe',                          # Format is 'image2pipe'
                    '-pix_fmt', pixel_format,                    # Pixel format we will use internally
                    '-vcodec', 'rawvideo',                       # Set video codec to 'rawvideo'
-                   '-']                                         # Pipe the output
-
-        # Read the video data
-        logger.debug(f'Calling ffmpeg to get video \"{' '.join(command)}\"')
-        completed_process = subprocess.run(command, capture_output=True)
-
-        # Get all frames
-        frame_length = self._video['width'] * self._video['height'] * pixel_format_info['nb_components']
-        video_frames = []
-        for i in range(0, len(completed_process.stdout), frame_length):
-            frame = completed_process.stdout[i:i + frame_length]
-            frame = (np.fromstring(frame, dtype='uint8')
-                     .reshape(self._video['height'], self._video['width'], pixel_format_info['nb_components']))
+                   '-'])                                        # Pipe the output
 
+        # Size of a single frame
+        frame_shape = (self._video['height'], self._video['width'], pixel_format_info['nb_components'])
+        frame_length = frame_shape[0] * frame_shape[1] * frame_shape[2]
 
-            # Store the frame in our frames list
-            video_frames.append(frame)
-
-        # Return the video frames
-        return video_frames
+        # Read the video data, one frame at a time
+        logger.debug(f'Calling ffmpeg to stream video \"{' '.join(command)}\"')
+        process = subprocess.Popen(command, stdout=PIPE, stderr=DEVNULL, bufsize=frame_length)
+        try:
+            while True:
+                frame = np.empty(frame_shape, dtype='uint8')
+                if process.stdout.readinto(memoryview(frame).cast('B')) < frame_length:
+                    break
+
+                yield frame
+        finally:
+            # Stop ffmpeg if we were not iterated through to the end
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
 
     def get_video_frame(self,
                   frame_index:int=None,
@@ -2304,14 +3526,8 @@ class Clip:
 
         :return self: Enables method chaining
         """
-        altered_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).convert(ImageModes.GRAYSCALE.value)
-            frame = np.stack((np.array(image), np.array(image), np.array(image)), axis=2).astype('uint8')
-            altered_frames.append(frame)
-
-        # Replace the clip frames with the now rotated frames
-        self.set_video_frames(altered_frames)
+        # Convert each frame, replacing the clip frames
+        self._execute_video_frames(Clip._grayscale_frame)
 
         # Return this object to enable method chaining
         return self
@@ -2322,13 +3538,8 @@ class Clip:
 
         :return self: Enable method chaining
         """
-        flipped_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).transpose(Transpose.FLIP_LEFT_RIGHT.value)
-            flipped_frames.append(np.array(image))
-
-        # Replace the clip frames with the now rotated frames
-        self.set_video_frames(flipped_frames)
+        # Reverse the columns of each frame
+        self._transform_video_frames(lambda frames: frames[..., ::-1, :])
 
         # Return this object to enable method chaining
         return self
@@ -2339,13 +3550,8 @@ class Clip:
 
         :return self: Enable method chaining
         """
-        flipped_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).transpose(Transpose.FLIP_TOP_BOTTOM.value)
-            flipped_frames.append(np.array(image))
-
-        # Replace the clip frames with the now rotated frames
-        self.set_video_frames(flipped_frames)
+        # Reverse the rows of each frame
+        self._transform_video_frames(lambda frames: frames[..., ::-1, :, :])
 
         # Return this object to enable method chaining
         return self
@@ -2378,13 +3584,9 @@ class Clip:
         # Multiply colors in each frame
         logger.debug(f"Multiply Colors - Red x {red_multiplier}, Green x {green_multiplier}, "
                      f"Blue x {blue_multiplier}, Luminance={luminance}")
-        altered_frames = []
         luminance_array = np.array([luminance, luminance, luminance])
-        for frame in self.get_video_frames():
-            altered_frames.append((frame * (red_multiplier, green_multiplier, blue_multiplier) * luminance_array).astype('uint8'))
-
-        # Replace the existing frames
-        self.set_video_frames(altered_frames)
+        multipliers = (red_multiplier, green_multiplier, blue_multiplier)
+        self.apply_lut(self._lookup_table(lambda values: (values * multipliers * luminance_array).astype('uint8')))
 
         # Return this object to enable method chaining
         return self
@@ -2398,39 +3600,8 @@ class Clip:
         logger = getLogger(__name__)
         logger.debug(f'{type(self).__name__}.painting(saturation={saturation},black={black})')
 
-        video_frames = self.get_video_frames()
-        new_frames = []
-        for frame in video_frames:
-            # Convert frame into a PIL Image
-            image = Image.fromarray(frame)
-            image = image.filter(ImageFilter.EDGE_ENHANCE_MORE)
-
-            # Convert the image to grayscale
-            grayscale_image = image.convert("L")
-
-            # Find the image edges
-            edges_image = grayscale_image.filter(ImageFilter.FIND_EDGES)
-
-            # Convert the edges image to a numpy array
-            edges = np.array(edges_image)
-
-            # Create the darkening effect
-            darkening = black * (255 * np.dstack(3 * [edges]))
-
-            # Apply the painting effect
-            painting = saturation * np.array(image) - darkening
-
-            # Clip the pixel values to the valid range of 0-255
-            painting = np.maximum(0, np.minimum(255, painting))
-
-            # Convert the pixel values to unsigned 8-bit integers
-            painting = painting.astype("uint8")
-
-            # Add this frame
-            new_frames.append(painting)
-
-        # Set Video Frames
-        self.set_video_frames(new_frames)
+        # Paint each frame, and set the video frames
+        self._execute_video_frames(partial(Clip._painting_frame, saturation=saturation, black=black))
 
         # Enables method chaining
         return self
@@ -2493,18 +3664,13 @@ class Clip:
 
 
         # Update the frames
-        altered_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).resize((new_width, new_height), kwargs['resample'])
-            altered_frames.append(np.array(image).astype('uint8'))
+        self._execute_video_frames(partial(Clip._resize_frame, size=(new_width, new_height),
+                                           resample=kwargs['resample']))
 
         # Adjust the size of the clip
         self.height = new_height
         self.width = new_width
 
-        # Set the new frames for this video
-        self.set_video_frames(altered_frames)
-
         # Return this object to enable method chaining
         return self
 
@@ -2529,14 +3695,8 @@ class Clip:
 
         #TODO: Add clip_start and clip_end as parameters to this method
 
-        # Rotate each frame in the clip
-        rotated_frames = []
-        for frame in self.get_video_frames():
-            image = Image.fromarray(frame).rotate(angle)
-            rotated_frames.append(np.array(image))
-
-        # Replace the clip frames with the now rotated frames
-        self.set_video_frames(rotated_frames)
+        # Rotate each frame in the clip, replacing the clip frames
+        self._execute_video_frames(partial(Clip._rotate_frame, angle=angle))
 
         # Return this object to enable method chaining
         return self
@@ -2594,15 +3754,19 @@ class Clip:
     def set_video_frames(self, value):
         """
         Set the new clip frames
+
+        :param value: List of numpy.array frames, or a single (N, height, width, components) numpy.array
+        :raises ValueError: When value is neither a list nor a numpy array of frames
         """
-        if not isinstance(value, list):
-            raise ValueError(f"{type(self).__name__}.clip_frames must be a list of numpy.array objects")
+        if not isinstance(value, (list, np.ndarray)):
+            raise ValueError(f"{type(self).__name__}.clip_frames must be a list of numpy.array objects "
+                             f"or a numpy.array of frames")
 
         # The video frames have now been initialized
         self._video['frames_initialized'] = True
 
-        # Set the video frames to the new list of frames
-        self._video['frames'] = value
+        # Set the video frames to the new frames, in the clip's frame store
+        self._video['frames'] = self._collect_video_frames(value, len(value))
 
         # Update the number of frames
         self.number_frames = len(value)
@@ -2626,7 +3790,7 @@ class Clip:
         logger.debug(f'{type(self).__name__}.time_symmetrize()')
 
         # Get the video frames
-        video_frames = self.get_video_frames()
+        video_frames = list(self.get_video_frames())
         logger.debug(f'{len(video_frames)} initial video frames')
 
         # Replace the existing video frames with the footage and followed by the footage reversed
@@ -2639,31 +3803,77 @@ class Clip:
         return self
 
 
-    def stipple(self, threshold:int=25):
+    def stipple(self, threshold:int=25, seed:int=None):
         """
         Stipple the video footage
 
         Affects: Video
 
+        :param threshold: Difference between neighbouring pixels, at which an edge is detected
+        :param seed: Seed for the random removal of edge points. The same seed reproduces the same output
         :return self: Return this object itself. This enables method chaining.
         """
         logger = getLogger(__name__)
-        logger.debug(f'{type(self).__name__}.stipple(threshold={threshold})')
+        logger.debug(f'{type(self).__name__}.stipple(threshold={threshold}, seed={seed})')
 
-        video_frames = self.get_video_frames()
-        logger.debug(f'{len(video_frames)} video frames pre effect')
+        # Each frame gets its own seed, derived from the seed given and the frame's index
+        self._execute_video_frames(Clip._stipple_frame,
+                                   lambda frame_index: threshold,
+                                   lambda frame_index: None if seed is None else (int(seed), frame_index))
+        logger.debug(f'{self.number_frames} video frames post effect')
 
-        stippled_frames = []
-        for frame in video_frames:
-            frame_image = Image.fromarray(frame)
-            stippled_frame = np.array(self._stipple_frame(frame_image, threshold))
+        # Return this object to enable method
+        return self
 
-            stippled_frames.append(stippled_frame.astype('uint8'))
+    def tone_curve(self, curve=None, red_curve=None, green_curve=None, blue_curve=None):
+        """
+        Apply a tone curve to the video.
+        A curve is either a list of (input, output) control points, linearly interpolated between,
+        or a function of a numpy array of the pixel values 0-255 returning their new values.
 
-        logger.debug(f'{len(stippled_frames)} video frames post effect')
-        self.set_video_frames(stippled_frames)
+        Affects: Video
 
-        # Return this object to enable method
+        :param curve: Curve for the red, green and blue components
+        :param red_curve: Curve for the red component (replaces curve)
+        :param green_curve: Curve for the green component (replaces curve)
+        :param blue_curve: Curve for the blue component (replaces curve)
+        :raises ValueError: When control points are not (input, output) pairs
+        :return self: Enables method chaining
+        """
+        logger = getLogger(__name__)
+        logger.debug(f'{type(self).__name__}.tone_curve(curve={curve}, red_curve={red_curve}, '
+                     f'green_curve={green_curve}, blue_curve={blue_curve})')
+
+        # Component curves replace the curve for all components
+        curves = [component_curve if component_curve is not None else curve
+                  for component_curve in (red_curve, green_curve, blue_curve)]
+        if all(component_curve is None for component_curve in curves):
+            logger.warning(f"No tone curve supplied. No work needed.")
+            return self
+
+        # Evaluate each curve for every pixel value
+        values = np.arange(256)
+        component_tables = []
+        for component_curve in curves:
+            if component_curve is None:
+                component_tables.append(values)
+            elif callable(component_curve):
+                component_tables.append(np.asarray(component_curve(values), dtype='float64'))
+            else:
+                points = np.asarray(component_curve, dtype='float64')
+                if (points.ndim != 2) or (points.shape[1] != 2) or (points.shape[0] < 2):
+                    raise ValueError(f"Tone curve control points must be at least two (input, output) pairs.")
+                points = points[np.argsort(points[:, 0])]
+                component_tables.append(np.interp(values, points[:, 0], points[:, 1]))
+
+        # Round and clip the curves to valid pixel values, for the components this pixel format has
+        number_components = PIXEL_FORMATS[self.pixel_format]['nb_components']
+        lookup_table = np.clip(np.rint(np.stack(component_tables)), 0, 255).astype('uint8')
+
+        # Apply the lookup table
+        self.apply_lut(lookup_table[:number_components])
+
+        # Enable method chaining
         return self
 
     def trim(self, exclude_before=None, exclude_after=None):
@@ -2683,22 +3893,40 @@ class Clip:
         if not exclude_before and not exclude_after:
             logger.warning(f"No trimming requested")
 
-        # We need to trim material at the beginning of the clip
-        if exclude_before:
-            self.start_time = exclude_before
+        # Apply any pending effects to the frames in memory, before their start and end times change
+        if self._video['frames_initialized'] and self._video['operations']:
+            self.get_video_frames()
 
-        # We need to trim material at the end of the clip
-        if exclude_after:
-            self.end_time = exclude_after
+        # Frames already in memory start at the time they were read from (or trimmed to), not necessarily at 0
+        video_start_time = self._video['frames_start_time']
+        if self._video['frames_initialized']:
+            start_time, end_time = video_start_time, video_start_time + len(self._video['frames']) / self.fps
+        else:
+            start_time, end_time = self.start_time, self.end_time
 
-        # Alter the video frames accordingly
-        if self.has_video:
+        # We need to trim material at the beginning and/or end of the clip
+        start_time = float(exclude_before) if exclude_before else start_time
+        end_time = float(exclude_after) if exclude_after else end_time
+
+        # Alter the video frames accordingly. Frames already in memory are sliced, relative to their start time,
+        # otherwise only the frames between the new start and end times get decoded
+        if self.has_video and self._video['frames_initialized']:
+            video_frames = self.get_video_frames()[round((start_time - video_start_time) * self.fps):
+                                                   round((end_time - video_start_time) * self.fps)]
+            self.set_video_frames(video_frames)
+            self._video['frames_start_time'] = start_time
+        elif self.has_video:
+            self.start_time = start_time
+            self.end_time = end_time
             self.set_video_frames(self.get_video_frames())
 
-        # Alter the audio data accordingly
+        # Alter the audio data accordingly, relative to the start time of the audio in memory
         if self.has_audio:
             audio_frames = self.get_audio_frames()
-            self.set_audio_frames(audio_frames[self.audio_start_index:self.audio_end_index])
+            audio_start_time = self._audio['frames_start_time']
+            self.set_audio_frames(audio_frames[round((start_time - audio_start_time) * self.audio_sample_rate):
+                                               round((end_time - audio_start_time) * self.audio_sample_rate)])
+            self._audio['frames_start_time'] = start_time
 
         # Enable method chaining
         return self
@@ -2723,12 +3951,18 @@ class Clip:
         # Enable method chaining
         return self
 
-    def write_image(self, file_path, frame_index:int=0, frame_time:int=None) -> bool:
+    def write_image(self, file_path, frame_index:int=0, frame_time:int=None, encoder_profile=None) -> bool:
         """
         Write a single frame out as an image file
+        :param file_path: Output image's path
+        :param frame_index: Index of the frame to write
+        :param frame_time: Time of the frame to write
+        :param encoder_profile: EncoderProfile, profile name or dict of settings, defaults to Clip.encoder_profile.
+                                Only its codec and threads apply to images
         :return: True, if successful
         """
         logger = getLogger(__name__)
+        encoder_profile = self.encoder_profile if encoder_profile is None else EncoderProfile.from_value(encoder_profile)
 
         # Ensure we have valid input
         if (frame_index is None) and (frame_time is None):
@@ -2748,6 +3982,7 @@ class Clip:
                    '-f','rawvideo',
                    '-pix_fmt', self.pixel_format, # Format that we will be sending the data in
                    '-i', '-',
+                   *encoder_profile.image_options(),
                    file_path
                    ]
 
@@ -2772,37 +4007,47 @@ class Clip:
                     audio_codec=None,
                     file_video_codec=None,
                     file_pixel_format='yuv420p',
-                    ffmpeg_log_level='error'):
+                    ffmpeg_log_level='error',
+                    segments:int=1,
+                    encoder_profile=None):
         """
         Writes this clip to a video file
 
         :param file_path: Output video's path
         :param write_audio: Boolean, should we write the audio as well as the video. Defaults to True.
         :param audio_codec: Audio Codec to use
-        :param file_video_codec: Video Codec to use when writing the file
+        :param file_video_codec: Video Codec to use when writing the file, overrides the encoder profile's codec
+        :param file_pixel_format: Pixel format of the video file
+        :param ffmpeg_log_level: Sets the log level of ffmpeg
+        :param segments: Split the video into this many segments, encoded in parallel ffmpeg processes,
+                         then joined without re-encoding. Requires the video frames to be read into memory.
+        :param encoder_profile: EncoderProfile, profile name (see ENCODER_PROFILES) or dict of settings,
+                                defaults to Clip.encoder_profile
+        :raises ValueError: When there is no video codec for the file's extension, or the profile is invalid
         """
         # Get a logger
         logger = getLogger(__name__)
         logger.debug(f"{type(self).__name__}.write_video(file_path={file_path}, write_audio={write_audio}, "
                      f"audio_codec={audio_codec}, file_video_codec={file_video_codec}, "
-                     f"file_pixel_format={file_pixel_format}, ffmpeg_log_level={ffmpeg_log_level})")
+                     f"file_pixel_format={file_pixel_format}, ffmpeg_log_level={ffmpeg_log_level}, "
+                     f"segments={segments}, encoder_profile={encoder_profile})")
+        encoder_profile = self.encoder_profile if encoder_profile is None else EncoderProfile.from_value(encoder_profile)
 
         # Get filename and extension from the file path
         file_name, ext = os.path.splitext(os.path.basename(file_path))
         ext = ext[1:].lower()
 
         # Ensure we were given a video codec or have a default for this file extension
-        if (file_video_codec is None) and (ext in VIDEO_CODECS):
+        file_video_codec = file_video_codec or encoder_profile.codec
+        if file_video_codec is None:
+            if ext not in VIDEO_CODECS:
+                raise ValueError(f"No default video codec found for '{ext}'")
             file_video_codec = VIDEO_CODECS[ext][0]
-        else:
-            raise ValueError(f"No default video codec found for '{ext}'")
 
-        # Ensure we were given a video codec or have a default for this file extension
+        # Ensure we were given an audio codec or have a default for this file extension
         # otherwise default to 'libmp3lame'
-        if (audio_codec is None) and (ext in AUDIO_CODECS):
-            audio_codec = AUDIO_CODECS[ext][0]
-        else:
-            audio_codec = "libmp3lame"
+        if audio_codec is None:
+            audio_codec = AUDIO_CODECS[ext][0] if ext in AUDIO_CODECS else "libmp3lame"
 
         # Determine audio extension
         audio_extension = None
@@ -2822,11 +4067,52 @@ class Clip:
                    '-i', '-',                                # the input comes from a pipe
                    ]
 
+        # Parameters relating to encoding the video
+        video_options = encoder_profile.video_options(file_video_codec) + [
+                        '-pix_fmt', file_pixel_format]  # Pixel format for the final file to write
+
+        # Encode the video as segments in parallel, then join the segments without re-encoding them
+        segment_directory = None
+        if segments > 1:
+            segment_directory = tempfile.mkdtemp(prefix=f'{file_name}_segments_', dir=self.scratch_directory)
+            segment_paths = self._write_video_segments(command, video_options, segments, segment_directory, ext)
+
+            # List the segments for ffmpeg's concat demuxer
+            segment_list = os.path.join(segment_directory, 'segments.txt')
+            with open(segment_list, 'w') as f:
+                for segment_path in segment_paths:
+                    f.write(f"file '{os.path.abspath(segment_path)}'\n")
+
+            # Replace the raw video input with the encoded segments, which are copied as they are
+            command = [self.ffmpeg_binary,
+                       '-y',                                 # Overwrite output file if it exists
+                       '-loglevel', ffmpeg_log_level,        # Set ffmpeg's log level accordingly
+                       '-f', 'concat',                       # Concatenate the files listed
+                       '-safe', '0',                         # Allow absolute paths in the list
+                       '-i', segment_list]
+            video_options = ['-vcodec', 'copy']
+
         # If we have an audio stream and we are to write audio
         audio_file_name = None
-        if self._audio and write_audio:
-            # Write the audio to disk
-            audio_file_name = f"{file_name}_wvf_snd.tmp.{audio_extension}"
+        audio_read_descriptor = None
+        audio_write_descriptor = None
+        if self._audio and write_audio and (os.name == 'posix'):
+            # Raw audio is fed to this same ffmpeg process through a second pipe, and encoded along with the video
+            audio_read_descriptor, audio_write_descriptor = os.pipe()
+            command.extend([
+                '-f', 's8' if self.audio_channels == 1 else 's%dle' % (8 * self.audio_channels),
+                '-acodec', 'pcm_u8' if self.audio_channels == 1 else 'pcm_s%dle' % (8 * self.audio_channels),
+                '-ar', '%d' % self.audio_sample_rate,
+                '-ac', '%d' % self.audio_channels,
+                '-i', f'pipe:{audio_read_descriptor}',
+                '-acodec', audio_codec
+            ])
+        elif self._audio and write_audio:
+            # We can not pass ffmpeg a second pipe, so write the audio to a uniquely named scratch file
+            file_descriptor, audio_file_name = tempfile.mkstemp(prefix=f'{file_name}_wvf_snd_',
+                                                                suffix=f'.{audio_extension}',
+                                                                dir=self.scratch_directory)
+            os.close(file_descriptor)
             self._write_audio(file_path=audio_file_name,
                               ffmpeg_log_level=ffmpeg_log_level)
 
@@ -2840,25 +4126,43 @@ class Clip:
             command.extend(['-an']) # tells FFMPEG not to expect any audio
 
         # Parameters relating to the output/final file
-        command.extend([
-            '-vcodec', file_video_codec,                #
-            '-preset', 'medium',                        # ???
-            '-pix_fmt', file_pixel_format,              # Pixel format for the final file to write
-            file_path])
+        command.extend(video_options + [file_path])
 
         # Log the ffmpeg call we will make
         logger.debug(f"Calling ffmpeg to write video \"{' '.join(command)}\"")
 
-        # Write all the video frame data to the PIPE's standard input
-        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE,  bufsize=10 ** 8)
-        for frame in self.get_video_frames():
-            process.stdin.write(frame.tobytes())
-
-        process.stdin.close()
-        process.wait()
-
-        # Delete the audio temp  file we created as needed
-        if audio_file_name:
-            os.remove(audio_file_name)
+        # Start ffmpeg, handing it the read end of the audio pipe (if any)
+        pass_descriptors = () if audio_read_descriptor is None else (audio_read_descriptor,)
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stdin=subprocess.PIPE, bufsize=0,
+                                       pass_fds=pass_descriptors)
+        finally:
+            if audio_read_descriptor is not None:
+                os.close(audio_read_descriptor)
+
+        # Write the audio to its pipe from another thread, as ffmpeg reads the audio and video as it needs them
+        audio_writer = None
+        if audio_write_descriptor is not None:
+            audio_writer = Thread(target=self._write_pipe,
+                                  args=(open(audio_write_descriptor, 'wb', buffering=0), [self.get_audio_frames()]),
+                                  name='write_audio', daemon=True)
+            audio_writer.start()
+
+        # Write all the video frame data to the PIPE's standard input, from a background thread,
+        # so the frames are produced while ffmpeg encodes the earlier frames (segments were already encoded)
+        try:
+            if not segment_directory:
+                write_frames(process.stdin, self.iter_video_frames(), WRITER_QUEUE_SIZE)
+        finally:
+            process.stdin.close()
+            if audio_writer:
+                audio_writer.join()
+            process.wait()
+
+            # Delete the audio temp file and the segments we created as needed
+            if audio_file_name:
+                os.remove(audio_file_name)
+            if segment_directory:
+                shutil.rmtree(segment_directory, ignore_errors=True)
 
         logger.info(f"Video written to '{file_path}'")
\ No newline at end of file
@@ -20,7 +20,7 @@ class ColorClip(ImageClip):
         :raises ValueError: When end_time is not a number
         """
         # Ensure size is a list or a tuple
-        if not isinstance(size, (tuple, list) or (len(size) != 2)):
+        if (not isinstance(size, (tuple, list))) or (len(size) != 2):
             raise ValueError(f"{type(self).__name__}(size=) must be an a tuple or a list of (width, height)")
 
         # Ensure end_time is a number
@@ -34,11 +34,9 @@ class ColorClip(ImageClip):
             pixel_format = 'rgba'
         number_components = PIXEL_FORMATS[pixel_format]['nb_components']
 
-        # Create the necessary frames
-        video_frames = []
+        # Create the necessary frames, every frame is the same frame object, so effects only alter it once
         frame = numpy.tile(color, size[0] * size[1]).reshape(size[1], size[0], number_components).astype('uint8')
-        for x in range(int(fps * end_time)):
-            video_frames.append(frame)
+        video_frames = [frame] * int(fps * end_time)
 
         # Instantiate ImageClip
         super().__init__(video_frames=video_frames,
@@ -47,4 +45,7 @@ class ColorClip(ImageClip):
                          clip_width=size[0],
                          clip_height=size[1],
                          clip_fps=fps,
+                         video_duration=end_time,
+                         video_nb_frames=len(video_frames),
+                         video_fps=fps,
                          **kwargs)
\ No newline at end of file
@@ -1,6 +1,7 @@
+from itertools import islice
 from logging import getLogger
 from .Clip import Clip
-from ..constants import PIXEL_FORMATS
+from ..constants import BlendMode, MaskType, PIXEL_FORMATS
 import numpy
 
 class CompositeClip(Clip):
@@ -40,40 +41,17 @@ class CompositeClip(Clip):
         # CompositeClip specific attributes
         self._clips = clips
 
-        # Calculate size and determine the pixel format we will be using for this clip
+        # Calculate size, frame rate and number of frames, and determine the pixel format we will be using
         pixel_format = 'rgb24'
         size = [0,0]
+        fps = 0
+        number_frames = 0
         for clip in clips:
             pixel_format = 'rgba' if clip.pixel_format == 'rgba' else pixel_format
             size[0] = clip.width if clip.width > size[0] else size[0]
             size[1] = clip.height if clip.height > size[1] else size[1]
-
-        # Set the max frames for this clip
-
-
-        # Load clip data needed to composite the clip
-        clip_data = {}
-        number_frames = 0
-
-        for i in range(len(clips)):
-            # Add the new clip to our clip data
-            clip_data[i] = {'mask_frames': None, 'frames': None, 'size': None, 'position': None}
-
-            # Load frames for the ith clip
-            clip_data[i]['frames'] = self._clips[i].get_frames()
-
-            # Load the mask for the ith clip
-            clip_data[i]['mask_frames'] = self._clips[i].get_mask_frames()
-
-            # Load the size for the ith clip
-            clip_data[i]['size'] = self._clips[i].size
-
-            # Load the position for the ith clip
-            clip_data[i]['position'] = self._clips[i].x,self._clips[i].y
-
-            if self._clips[i].number_frames > number_frames:
-                number_frames = self._clips[i].number_frames
-
+            fps = clip.fps if clip.fps > fps else fps
+            number_frames = clip.number_frames if clip.number_frames > number_frames else number_frames
 
         # Either use the provided size for the clip or if none was provided, use the calculated dimensions
         clip_height = size[1] if clip_height is None else clip_height
@@ -86,60 +64,233 @@ class CompositeClip(Clip):
         if clip_background_color is None:
             clip_background_color = numpy.tile(0,number_components)
 
-        # Generate the blank frame and mask
-        blank_frame = (numpy.tile(clip_background_color, clip_width * clip_height).
-               reshape(clip_height, clip_width, number_components).astype('uint8'))
-
-        blank_mask_cell = numpy.tile(False, number_components)
-        blank_mask = numpy.tile(blank_mask_cell, clip_width * clip_height).reshape(clip_height, clip_width, number_components).astype('uint8')
-
-        # Composite the frames
-        composited_frames = []
-
-        for frame_index in range(number_frames):
-            # We are starting a new frame, so reset the composited frame
-            composited_frame = None
-
-            # Loop through the clips and composite them for this frame
-            for clip_index in range(len(clips)):
-                # Get the clip frame, skip to the next clip if there is no frame for this clip
-                try:
-                    composite_frame = clip_data[clip_index]['frames'][frame_index]
-                    composite_mask = clip_data[clip_index]['mask_frames'][frame_index]
-                    composite_width, composite_height = clip_data[clip_index]['size']
-                    composite_x, composite_y = clip_data[clip_index]['position']
-                    row_end = composite_y+composite_height
-                    col_end = composite_x+composite_width
-                except IndexError:
-                    continue
-
-                # Create the broadcast frame and mask from the blank frame and mask respectively
-                broadcast_frame = blank_frame
-                broadcast_mask = blank_mask
-
-                # Broadcast the clip's frame to a frame of the correct dimensions
-                broadcast_frame[composite_y:row_end,composite_x:col_end] = composite_frame
-
-                # Broadcast the clip's mask to a mask of the correct dimensions
-                broadcast_mask[composite_y:row_end,composite_x:col_end] = composite_mask
-
-                # Composite this clip onto the frame
-                if composited_frame is not None:
-                    composited_frame = numpy.where(broadcast_mask, broadcast_frame, composited_frame)
-                else:
-                    # Composite the against the blank frame
-                    composited_frame = numpy.where(broadcast_mask, broadcast_frame, blank_frame)
-
-
-            # Add it to our list of frames
-            composited_frames.append(composited_frame)
+        # Frames are rendered on demand (see _render_frame), nothing is read from the layers until then
+        self._composite = {
+            'background': (numpy.tile(clip_background_color, clip_width * clip_height)
+                           .reshape(clip_height, clip_width, number_components).astype('uint8')),
+            'frame_index': None,        # Index of the frame the layers will produce next
+            'layers': [],               # Iterators over each layer's (video frames, mask frames or None if opaque)
+            'scratch': [{} for _ in clips]} # uint64 buffers each layer is blended with, reused every frame
+        logger.debug(f'{type(self).__name__} of {len(clips)} layers, {number_frames} frames at {fps} fps')
 
         # Instantiate the ClipBase
         super().__init__(clip_end_time=clip_end_time,
                          clip_height=clip_height,
                          clip_pixel_format=pixel_format,
                          clip_width=clip_width,
-                         video_frames=composited_frames)
+                         video_duration=number_frames / fps if fps else 0,
+                         video_fps=fps,
+                         video_get_frame=self._render_frame,
+                         video_height=clip_height,
+                         video_nb_frames=number_frames,
+                         video_width=clip_width)
+
+    ###################
+    # Private Methods #
+    ###################
+    @staticmethod
+    def _alpha_blend_region(region, layer_region, mask_region, blend_mode:str, opacity:int, scratch:dict):
+        """
+        Blend a layer's region into the frame's region in place, using premultiplied alpha in uint64 fixed point.
+        Alphas are kept in units of 1 / (255 * 255) and premultiplied colors in units of 1 / (255 * 255) of a color
+        level, so the blend keeps 16 fractional bits and is only rounded to 8 bits once, when it is un-premultiplied.
+        Every intermediate is written into the scratch buffers, so nothing is allocated once they exist.
+
+        :param region: uint8 region of the frame being composited (rgb24 or rgba), updated in place
+        :param layer_region: uint8 region of the layer, in the frame's pixel format
+        :param mask_region: Region of the layer's mask, a bitmap or alpha plane (None if fully visible)
+        :param blend_mode: BlendMode value other than BlendMode.MASK
+        :param opacity: Opacity of the layer, from 0 to 255
+        :param scratch: Dictionary of uint64 buffers, (re)allocated when the region's size changes
+        """
+        # Fully opaque alpha, and a fully opaque white premultiplied color, in fixed point
+        opaque = 255 * 255
+        white = 255 * opaque
+
+        # Allocate the buffers the first time through, or when the region changed size
+        shape = region.shape[:2]
+        if scratch.get('shape') != shape:
+            scratch.clear()
+            scratch['shape'] = shape
+            for name in ('source', 'destination', 'product'):
+                scratch[name] = numpy.empty(shape + (3,), dtype='uint64')
+            for name in ('source_alpha', 'destination_alpha', 'alpha_product'):
+                scratch[name] = numpy.empty(shape + (1,), dtype='uint64')
+            scratch['visible'] = numpy.empty(shape + (1,), dtype=bool)
+        source, destination, product = scratch['source'], scratch['destination'], scratch['product']
+        source_alpha, destination_alpha = scratch['source_alpha'], scratch['destination_alpha']
+        alpha_product = scratch['alpha_product']
+
+        def divide_rounded(values, divisor):
+            # Rounded values / divisor, in place
+            numpy.add(values, divisor // 2, out=values)
+            numpy.floor_divide(values, divisor, out=values)
+
+        # Source alpha, from the layer's alpha channel, mask and opacity (alpha x mask needs no rounding)
+        if layer_region.shape[2] == 4:
+            numpy.copyto(source_alpha, layer_region[..., 3:])
+        else:
+            source_alpha.fill(255)
+        if (mask_region is not None) and (mask_region.dtype != bool):
+            numpy.multiply(source_alpha, mask_region, out=source_alpha)
+        else:
+            numpy.multiply(source_alpha, 255, out=source_alpha)
+            if mask_region is not None:
+                numpy.multiply(source_alpha, mask_region, out=source_alpha)
+        if opacity < 255:
+            numpy.multiply(source_alpha, opacity, out=source_alpha)
+            divide_rounded(source_alpha, 255)
+
+        # Premultiply the source, and the destination (opaque, unless it has an alpha channel)
+        numpy.copyto(source, layer_region[..., :3])
+        numpy.multiply(source, source_alpha, out=source)
+        numpy.copyto(destination, region[..., :3])
+        has_alpha = region.shape[2] == 4
+        if has_alpha:
+            numpy.copyto(destination_alpha, region[..., 3:])
+            numpy.multiply(destination_alpha, 255, out=destination_alpha)
+            numpy.multiply(destination, destination_alpha, out=destination)
+        else:
+            numpy.multiply(destination, opaque, out=destination)
+
+        # Blend the premultiplied colors, leaving the result in destination
+        if blend_mode == BlendMode.ADD.value:
+            numpy.add(destination, source, out=destination)
+        elif blend_mode == BlendMode.SCREEN.value:
+            # source + destination - source * destination
+            numpy.multiply(source, destination, out=product)
+            divide_rounded(product, white)
+            numpy.add(destination, source, out=destination)
+            numpy.subtract(destination, product, out=destination)
+        else:
+            # Over: source + destination * (1 - source alpha)
+            # Multiply also adds source * destination, and source * (1 - destination alpha)
+            if blend_mode == BlendMode.MULTIPLY.value:
+                numpy.multiply(source, destination, out=product)
+                divide_rounded(product, white)
+            numpy.subtract(opaque, source_alpha, out=alpha_product)
+            numpy.multiply(destination, alpha_product, out=destination)
+            divide_rounded(destination, opaque)
+            numpy.add(destination, source, out=destination)
+            if blend_mode == BlendMode.MULTIPLY.value:
+                numpy.subtract(destination, source, out=destination)
+                numpy.add(destination, product, out=destination)
+                if has_alpha:
+                    numpy.subtract(opaque, destination_alpha, out=alpha_product)
+                    numpy.multiply(source, alpha_product, out=source)
+                    divide_rounded(source, opaque)
+                    numpy.add(destination, source, out=destination)
+        numpy.minimum(destination, white, out=destination)
+
+        # Without an alpha channel the frame is opaque, so the colors only need rounding back to 8 bits
+        if not has_alpha:
+            divide_rounded(destination, opaque)
+            numpy.copyto(region, destination, casting='unsafe')
+            return
+
+        # Resulting alpha, added for BlendMode.ADD, otherwise source alpha + destination alpha * (1 - source alpha)
+        if blend_mode == BlendMode.ADD.value:
+            numpy.add(destination_alpha, source_alpha, out=destination_alpha)
+            numpy.minimum(destination_alpha, opaque, out=destination_alpha)
+        else:
+            numpy.subtract(opaque, source_alpha, out=alpha_product)
+            numpy.multiply(destination_alpha, alpha_product, out=destination_alpha)
+            divide_rounded(destination_alpha, opaque)
+            numpy.add(destination_alpha, source_alpha, out=destination_alpha)
+
+        # Un-premultiply the colors (rounded), fully transparent pixels are black
+        visible = scratch['visible']
+        numpy.greater(destination_alpha, 0, out=visible)
+        numpy.right_shift(destination_alpha, 1, out=alpha_product)
+        numpy.add(destination, alpha_product, out=destination)
+        numpy.floor_divide(destination, destination_alpha, out=destination, where=visible)
+        numpy.multiply(destination, visible, out=destination)
+        numpy.minimum(destination, 255, out=destination)
+        numpy.copyto(region[..., :3], destination, casting='unsafe')
+        divide_rounded(destination_alpha, 255)
+        numpy.copyto(region[..., 3:], destination_alpha, casting='unsafe')
+
+    @staticmethod
+    def _blend_layer(frame, layer_frame, layer_mask, position:tuple, blend_mode:str=BlendMode.MASK.value,
+                     opacity:float=1.0, scratch:dict=None):
+        """
+        Blend a layer into a frame in place, only touching the layer's bounding box (clipped to the frame)
+
+        :param frame: Frame being composited
+        :param layer_frame: Layer's video frame, in the frame's pixel format
+        :param layer_mask: Layer's (height, width, 1) mask frame, a bitmap or alpha plane (None if fully visible)
+        :param position: (x, y) of the layer's top left corner within the frame
+        :param blend_mode: How the layer is blended with the frame (see BlendMode)
+        :param opacity: Opacity of the layer (0 to 1), layers blended with BlendMode.MASK are blended with
+                        BlendMode.OVER when they are not fully opaque
+        :param scratch: Dictionary of buffers reused by this layer, from frame to frame
+        """
+        x, y = position
+        layer_height, layer_width = layer_frame.shape[:2]
+
+        # Clip the layer's bounding box to the frame, nothing to do when it lies outside the frame
+        top, left = max(y, 0), max(x, 0)
+        bottom, right = min(y + layer_height, frame.shape[0]), min(x + layer_width, frame.shape[1])
+        if (top >= bottom) or (left >= right):
+            return
+
+        layer_region = layer_frame[top - y:bottom - y, left - x:right - x]
+        mask_region = None if layer_mask is None else layer_mask[top - y:bottom - y, left - x:right - x]
+
+        # Copy the layer over the frame, only its visible pixels when it has a bitmap mask
+        opacity = round(float(opacity) * 255)
+        if ((blend_mode == BlendMode.MASK.value) and (opacity == 255)
+                and ((mask_region is None) or (mask_region.dtype == bool))):
+            if mask_region is None:
+                frame[top:bottom, left:right] = layer_region
+            else:
+                numpy.copyto(frame[top:bottom, left:right], layer_region, where=mask_region)
+            return
+
+        # Alpha blend the layer with the frame
+        if blend_mode == BlendMode.MASK.value:
+            blend_mode = BlendMode.OVER.value
+        CompositeClip._alpha_blend_region(frame[top:bottom, left:right], layer_region, mask_region,
+                                          blend_mode, opacity, {} if scratch is None else scratch)
+
+    def _render_frame(self, frame_index:int, frame_time:float):
+        """
+        Composite a single frame, the clip's get_video_frame function.
+        Layers stream their frames, so frames are cheapest when requested in order.
+
+        :param frame_index: Index of the frame to composite
+        :param frame_time: Time, in seconds, of the frame to composite
+        :return frame, frame_size: The composited frame, and its (width, height)
+        """
+        # The layers are streamed, so (re)start them when the frame is not the next one they will produce
+        if frame_index != self._composite['frame_index']:
+            self._composite['layers'] = []
+            for clip in self._clips:
+                layer_frames = clip.iter_video_frames(self.pixel_format)
+                next(islice(layer_frames, frame_index, frame_index), None)
+
+                # Layers without a mask are not masked at all
+                layer_masks = None
+                if clip.mask_type != MaskType.OPAQUE.value:
+                    layer_masks = clip.iter_mask_frames()
+                    next(islice(layer_masks, frame_index, frame_index), None)
+                self._composite['layers'].append((layer_frames, layer_masks))
+        self._composite['frame_index'] = frame_index + 1
+
+        # Start from the background, then blend each layer's bounding box over it, in order
+        frame = self._composite['background'].copy()
+        for clip, (layer_frames, layer_masks), scratch in zip(self._clips, self._composite['layers'],
+                                                              self._composite['scratch']):
+            # Skip layers that have run out of frames
+            layer_frame = next(layer_frames, None)
+            layer_mask = None if layer_masks is None else next(layer_masks, None)
+            if (layer_frame is None) or ((layer_masks is not None) and (layer_mask is None)):
+                continue
+
+            self._blend_layer(frame, layer_frame, layer_mask, clip.position, clip.blend_mode, clip.opacity, scratch)
+
+        return frame, (self.width, self.height)
+
     ####################
     # Property Methods #
     ####################
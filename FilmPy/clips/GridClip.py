@@ -1,90 +1,197 @@
+import os
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
+from logging import getLogger
+from PIL import Image
 from .Clip import Clip
-from FilmPy.constants import PIXEL_FORMATS
+from FilmPy.constants import ExecutorType, PIXEL_FORMATS, Resampling
 import numpy
 
 
 class GridClip(Clip):
+    """
+    GridClip is a clip that shows a grid of clips at once, e.g. several camera feeds side by side
+    """
     def __init__(self,
-                 video_end_time=300, # TODO: remove the need to have this set, this is a hack to make it work
-                                     # TODO: There is no 'video' for a composite clip so some upstream clip property is wrong
-                 clip_end_time=300,
-                 clips=None):
+                 clips:list=None,
+                 clip_background_color=None,
+                 clip_end_time=None,
+                 cell_height:int=None,
+                 cell_width:int=None,
+                 cell_resample=Resampling.BILINEAR.value,
+                 video_end_time=None):
         """
-        Composite all the clips into a grid showing all the videos at once
-
-        :param clip_end_time: End time in seconds for the clip
-        :param clips: Array of clips
+        Composite all the clips into a grid showing all the videos at once.
+        Frames are rendered on demand at the frame rate of the fastest clip, each cell showing its clip's frame at
+        that time, streamed and scaled to fit the cell.
+
+        :param clips: List of rows, each a list of clips. None leaves a cell empty
+        :param clip_background_color: Background color to use for the clip, will default to black if not provided
+        :param clip_end_time: End time in seconds for the clip, defaults to the end of the longest clip
+        :param cell_height: Height of each cell, defaults to the height of the tallest clip
+        :param cell_width: Width of each cell, defaults to the width of the widest clip
+        :param cell_resample: Resampling method used to scale clips to fit their cell (see Resampling)
+        :param video_end_time: Deprecated, the number of frames is determined from the clips
+        :raises ValueError: When clips is not a list of lists of clips, or a cell size is less than 1
         """
-        # Initialize ClipBase
-        super().__init__(
-            clip_end_time=clip_end_time,
-            video_end_time=video_end_time)
-
-        # Calculate the cell size for each clip
-        cell_size = [0,0]
-        max_rows_cols =  [0,0]
-        all_frames = {}
-        for x in range(len(clips)):
-            for j in range(len(clips[x])):
-                # Get the clip for this cell
-                clip = clips[x][j]
-                all_frames[x,j] = clip.get_video_frames()
-
-                # Determine max number of rows and columns
-                if x > max_rows_cols[0]:
-                    max_rows_cols[0] = x
-
-                if j > max_rows_cols[1]:
-                    max_rows_cols[1] = j
-
-                # Determine the cell size
-                w,h = clip.size
-                if w > cell_size[0]:
-                    cell_size[0] = w
-                if h > cell_size[1]:
-                    cell_size[1] = h
-
-
-
-        # TODO: switch to adding/using self.background_color
-        number_components = PIXEL_FORMATS[self.pixel_format]['nb_components']
-        if number_components == 3:
-            bg_pixel = (0,0,0)
-        elif number_components == 4:
-            bg_pixel = (0,0,0,1)
-
-        #TODO: determine the real number frames
-        composited_frames = []
-
-        clip_size = ((max_rows_cols[0]+1)*cell_size[1], cell_size[0]*(max_rows_cols[1]+1))
-        for frame_index in range(241):
-            frame = (numpy.tile(bg_pixel, clip_size[0] * clip_size[1])
-                     .reshape(clip_size[0], clip_size[1], number_components))
-
-            # Composite each clip onto the frame
-            for key,clip_frames in all_frames.items():
-                try:
-                    # Get the frame for this clip
-                    clip_frame = clip_frames[frame_index]
-                except IndexError:
-                    # This clip has no frame for this frame index, go onto the next frame
+        logger = getLogger(__name__)
+
+        # Ensure we have a list of rows, holding at least one clip
+        if ((not isinstance(clips, list)) or (not all(isinstance(row, list) for row in clips))
+                or (not any(clip is not None for row in clips for clip in row))):
+            raise ValueError(f"{type(self).__name__} expects clips to be a list of lists of clips.")
+
+        # Calculate the cell size, frame rate and duration, and determine the pixel format we will be using
+        pixel_format = 'rgb24'
+        size = [0, 0]
+        fps = 0
+        duration = 0
+        for clip in (clip for row in clips for clip in row if clip is not None):
+            pixel_format = 'rgba' if clip.pixel_format == 'rgba' else pixel_format
+            size[0] = clip.width if clip.width > size[0] else size[0]
+            size[1] = clip.height if clip.height > size[1] else size[1]
+            fps = clip.fps if clip.fps > fps else fps
+            duration = clip.duration if clip.duration > duration else duration
+
+        # The grid lasts as long as its longest clip, at the frame rate of its fastest clip
+        number_frames = round(duration * fps)
+
+        # Either use the provided cell size or if none was provided, use the calculated dimensions
+        cell_width = size[0] if cell_width is None else int(cell_width)
+        cell_height = size[1] if cell_height is None else int(cell_height)
+        if (cell_width < 1) or (cell_height < 1):
+            raise ValueError(f"cell_width ({cell_width}) and cell_height ({cell_height}) must be at least 1.")
+        number_rows = len(clips)
+        number_columns = max(len(row) for row in clips)
+        clip_height = number_rows * cell_height
+        clip_width = number_columns * cell_width
+
+        # Scale each clip to fit its cell, keeping its aspect ratio, centered within the cell
+        cells = []
+        for row_index, row in enumerate(clips):
+            for column_index, clip in enumerate(row):
+                if clip is None:
                     continue
 
+                scale = min(cell_width / clip.width, cell_height / clip.height)
+                width, height = max(1, round(clip.width * scale)), max(1, round(clip.height * scale))
+                x = column_index * cell_width + (cell_width - width) // 2
+                y = row_index * cell_height + (cell_height - height) // 2
+                cells.append((clip, (x, y), (width, height)))
+
+        # Get the number of components for this pixel format
+        number_components = PIXEL_FORMATS[pixel_format]['nb_components']
+
+        # Set the background color as needed
+        if clip_background_color is None:
+            clip_background_color = numpy.tile(0, number_components)
+        background = numpy.asarray(clip_background_color, dtype='uint8')
+
+        # Frames are rendered on demand (see _render_frame), into a single canvas
+        self._grid = {
+            'background': background,
+            'canvas': numpy.empty((clip_height, clip_width, number_components), dtype='uint8'),
+            'cells': cells,                                 # (clip, (x, y), (width, height)) of each cell
+            'cell_frames': [None] * len(cells),             # Iterators over each cell's video frames
+            'cell_frame_indexes': [None] * len(cells),      # Index of the clip frame each cell last drew
+            'pool': None,                                   # Threads the cells are drawn across
+            'resample': cell_resample.value if isinstance(cell_resample, Resampling) else cell_resample}
+        self._grid['canvas'][:] = background
+        logger.debug(f'{type(self).__name__} of {number_rows}x{number_columns} {cell_width}x{cell_height} cells, '
+                     f'{number_frames} frames at {fps} fps')
+
+        # Instantiate the ClipBase
+        super().__init__(clip_end_time=clip_end_time,
+                         clip_height=clip_height,
+                         clip_pixel_format=pixel_format,
+                         clip_width=clip_width,
+                         video_duration=duration,
+                         video_fps=fps,
+                         video_get_frame=self._render_frame,
+                         video_height=clip_height,
+                         video_nb_frames=number_frames,
+                         video_width=clip_width)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _cell_pool(self):
+        """
+        Get the threads cells are drawn across, per the clip's executor (see ExecutorType).
+        Cells stream from generators, which can not be sent to other processes, so the process executor uses threads
 
-                # Determine where in the clip it should go
-                x = key[0] * cell_size[1]
-                y = key[1] * cell_size[0]
+        :return pool: ThreadPoolExecutor, or None to draw the cells in this thread
+        """
+        if self._grid['pool'] is None:
+            workers = min(self.executor_workers or os.cpu_count() or 1, len(self._grid['cells']))
+            if (self.executor == ExecutorType.SERIAL.value) or (workers == 1):
+                return None
 
-                # Project the clip_frame onto the frame
-                frame[x:(x+cell_size[1]), y:(y+cell_size[0])] = clip_frame
-                frame = frame.astype('uint8')
+            # Shut the threads down along with the clip
+            self._grid['pool'] = ThreadPoolExecutor(max_workers=workers)
+            weakref.finalize(self, self._grid['pool'].shutdown, wait=False)
 
-            # Add the frame to the list of composited frames
-            composited_frames.append(frame)
+        return self._grid['pool']
 
-        # Set the width and height of the clip
-        self.width = clip_size[1]
-        self.height = clip_size[0]
+    def _draw_cell(self, cell_index:int, frame_time:float):
+        """
+        Draw a cell's frame at the given time into the canvas, scaling it to fit the cell as needed.
+        Cells stream their clip's frames, skipping forward to the frame shown at that time (or restarting
+        the stream when an earlier frame is needed).
 
-        # Set the frames for this clip
-        self.set_video_frames(composited_frames)
\ No newline at end of file
+        :param cell_index: Index of the cell to draw
+        :param frame_time: Time, in seconds, of the grid frame being drawn
+        """
+        clip, (x, y), (width, height) = self._grid['cells'][cell_index]
+        region = self._grid['canvas'][y:y + height, x:x + width]
+
+        # Each cell shows its clip's frame at the grid frame's time, whatever the clip's frame rate
+        frame_index = int(frame_time * clip.fps + 1e-6)
+        drawn_index = self._grid['cell_frame_indexes'][cell_index]
+
+        # The cell already shows this frame, as its clip is slower than the grid
+        if frame_index == drawn_index:
+            return
+
+        # The cells are streamed, so (re)start the cell when its frame is before the frame it last drew
+        if (drawn_index is None) or (frame_index < drawn_index):
+            self._grid['cell_frames'][cell_index] = clip.iter_video_frames(self.pixel_format)
+            drawn_index = -1
+        self._grid['cell_frame_indexes'][cell_index] = frame_index
+
+        # Skip the frames shown between grid frames, if the clip has run out of frames the cell is left empty
+        skipped_frames = frame_index - drawn_index - 1
+        cell_frame = next(islice(self._grid['cell_frames'][cell_index], skipped_frames, None), None)
+        if cell_frame is None:
+            region[:] = self._grid['background']
+            return
+
+        # Scale the frame to fit the cell, reducing large frames by whole factors first
+        if cell_frame.shape[:2] != (height, width):
+            image = Image.fromarray(numpy.ascontiguousarray(cell_frame))
+            cell_frame = numpy.asarray(image.resize((width, height), self._grid['resample'], reducing_gap=2.0))
+        region[:] = cell_frame
+
+    def _render_frame(self, frame_index:int, frame_time:float):
+        """
+        Render a single frame of the grid, the clip's get_video_frame function.
+        Cells stream their frames, so frames are cheapest when requested in order.
+
+        :param frame_index: Index of the frame to render
+        :param frame_time: Time, in seconds, of the frame to render
+        :return frame, frame_size: The rendered frame, and its (width, height)
+        """
+        # Draw each cell into the canvas, each cell only touches its own region of the canvas
+        pool = self._cell_pool()
+        cell_indexes = range(len(self._grid['cells']))
+        if pool is None:
+            for cell_index in cell_indexes:
+                self._draw_cell(cell_index, frame_time)
+        else:
+            for _ in pool.map(self._draw_cell, cell_indexes, repeat(frame_time)):
+                pass
+
+        # The canvas is drawn into again for the next frame, so return a copy of it
+        return self._grid['canvas'].copy(), (self.width, self.height)
@@ -73,11 +73,9 @@ class TextClip(ImageClip):
         )
 
 
-        # Create a frame of the appropriate size
-        video_frames = []
+        # Create a frame of the appropriate size, every frame is the same frame object, so effects only alter it once
         frame = np.array(image).astype('uint8')
-        for _ in range(int(fps * clip_end_time)):
-            video_frames.append(frame)
+        video_frames = [frame] * int(fps * clip_end_time)
 
         # Initialize the ImageClip
         super().__init__(
@@ -85,6 +83,9 @@ class TextClip(ImageClip):
                          clip_height=size[1],
                          clip_pixel_format=self._text['pixel_format'],
                          clip_width=size[0],
+                         video_duration=clip_end_time,
+                         video_nb_frames=len(video_frames),
+                         video_fps=fps,
                          video_frames=video_frames,
                          **kwargs)
 
@@ -1,5 +1,7 @@
 from enum import Enum
 from PIL.Image import Transpose as _PilTranspose, Resampling as _PILResampling
+from FilmPy.functions import (convert_gray_to_rgb24, convert_rgb24_to_gray, convert_rgb24_to_rgba,
+                              convert_rgba_to_rgb24)
 
 AUDIO_CODECS = {
     'ogg': ["libvorbis"],
@@ -13,16 +15,43 @@ BINARY_FFMPEG = "ffmpeg.exe"
 BINARY_FFPROBE = 'ffprobe.exe'
 BINARY_FFPLAY = 'ffplay.exe'
 
+DEFAULT_ENCODER_PROFILE = 'default'                         # Encoder profile used when writing files (see ENCODER_PROFILES)
+DEFAULT_EXECUTOR = 'thread'                                 # Executor per-frame effects run on (see ExecutorType)
+DEFAULT_EXECUTOR_CHUNK_SIZE = 4                             # Frames handed to an executor worker at a time
+DEFAULT_EXECUTOR_WORKERS = None                             # Executor workers, None uses every core
 DEFAULT_FRAME_RATE  = 30
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3                       # Bytes of video frames to hold in memory before using memmap
 DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_METADATA_CACHE_FILE = None                          # File information is cached in, None disables the disk cache
+DEFAULT_SCRATCH_DIRECTORY = None                            # Directory for memmap files, None is the system temp directory
 
 LOG_FILENAME = f"{__name__.split('.')[0]}.log"              # Default log file name to use
+METADATA_CACHE_VERSION = 4                                  # Increment when the parsed file information changes
+SEEK_PREROLL = 1.0                                          # Seconds decoded before the seek point, when frame accurate
 STANDARD_FRAME_RATES = (24,25,30,50,60)                     # Standard frame rates
+WRITER_QUEUE_SIZE = 8                                       # Frames queued between the effects and the encoder
 VIDEO_CODECS = {'mp4': ["libx264", "libmpeg4", "aac"],
                 'mkv': ["libx264", "libmpeg4", "aac"],
                 'ogv': ['libvorbis'],
                 'webm': ["libvorbis"]}
 
+# Encoder producing each codec, so re-encoded clips can be joined with the stream copied clips of a sequence
+STREAM_COPY_ENCODERS = {'h264': 'libx264',
+                        'hevc': 'libx265',
+                        'mpeg4': 'mpeg4',
+                        'vp8': 'libvpx',
+                        'vp9': 'libvpx-vp9',
+                        'av1': 'libaom-av1'}
+
+
+# Named encoder profiles, the settings ffmpeg encodes video files with (see EncoderProfile)
+# Faster presets trade a larger file for a faster encode, a lower crf trades a larger file for a higher quality
+ENCODER_PROFILES = {
+    'draft':   {'preset': 'ultrafast'},                     # Fastest encode, for previews and throughput-bound jobs
+    'fast':    {'preset': 'veryfast'},                      # Fast encode, reasonable file size
+    'default': {'preset': 'medium'},                        # ffmpeg's defaults
+    'archive': {'preset': 'slow', 'crf': 18}}               # Visually lossless, smaller files, slow encode
+
 
 # Audio formats
 # [nix:ffmpeg -formats | grep PCM] [windows: ffmpeg -formats | FINDSTR PCM]
@@ -693,6 +722,11 @@ I.... y210le                 3            20
 # Internal formats that FilmPy supports
 FILMPY_SUPPORTED_PIXEL_FORMATS = ('rgba','rgb24')
 
+# Pixel format conversions, PIXEL_FORMATS[source]['conversions'][destination] is a function of frame(s)
+PIXEL_FORMATS['gray']['conversions'] = {'rgb24': convert_gray_to_rgb24}
+PIXEL_FORMATS['rgb24']['conversions'] = {'gray': convert_rgb24_to_gray, 'rgba': convert_rgb24_to_rgba}
+PIXEL_FORMATS['rgba']['conversions'] = {'rgb24': convert_rgba_to_rgb24}
+
 class Sizes(Enum):
     """
     Standard video sizes
@@ -717,6 +751,55 @@ class Behavior(Enum):
     LOOP_FRAMES   = 1         # Loop over the existing material as needed
     PAD           = 2         # Add blank frames as needed
 
+# How a layer of a CompositeClip is combined with the layers beneath it
+class BlendMode(Enum):
+    """
+    Blend mode of a clip, when it is composited
+    """
+    MASK     = 'mask'         # The layer's pixels replace those beneath it, wherever its mask is set
+    OVER     = 'over'         # Alpha compositing, the layer is drawn over those beneath it ("over" operator)
+    ADD      = 'add'          # The layer's colors are added to those beneath it
+    MULTIPLY = 'multiply'     # The layer's colors are multiplied by those beneath it (darkens)
+    SCREEN   = 'screen'       # The inverted colors are multiplied, then inverted (lightens)
+
+# How a clip stores its mask frames
+class MaskType(Enum):
+    """
+    How a clip's mask is stored, masks are single channel bitmaps (bool) or alpha planes (uint8)
+    """
+    OPAQUE = 'opaque'         # Every pixel of every frame is visible, no mask frames are stored
+    STATIC = 'static'         # A single mask frame is used for every frame of the clip
+    FRAMES = 'frames'         # A mask frame per frame of the clip
+
+# How a clip stores its video frames in memory
+class FrameStore(Enum):
+    """
+    Backing store used for a clip's video frames
+    """
+    LIST  = 'list'            # A list of individual (height, width, components) frames
+    ARRAY = 'array'           # A single contiguous (frames, height, width, components) array
+    MEMMAP = 'memmap'         # A (frames, height, width, components) array, memory mapped to a scratch file
+    SHARED = 'shared'         # A (frames, height, width, components) array in shared memory, for worker processes
+
+# How per-frame effects are spread across cores
+class ExecutorType(Enum):
+    """
+    Executor used to apply per-frame effects
+    """
+    SERIAL  = 'serial'        # Frames are processed one after another, in the calling thread
+    THREAD  = 'thread'        # Frames are processed by a pool of threads (numpy and Pillow release the GIL)
+    PROCESS = 'process'       # Frames are processed by a pool of processes
+
+# How the number of frames in a video file was determined
+class FrameCount(Enum):
+    """
+    Method used to determine the number of frames in a video file, from most to least reliable
+    """
+    CONTAINER = 'container'   # Read from the container's metadata (nb_frames)
+    DECODE    = 'decode'      # Counted by decoding every frame (exact, but slow)
+    PACKETS   = 'packets'     # Counted from the stream's packets, without decoding them
+    ESTIMATE  = 'estimate'    # Estimated from the stream's duration and frame rate
+
 class Chess(Enum):
     BLACK = 'black'
     WHITE = 'white'
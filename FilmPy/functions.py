@@ -1,6 +1,9 @@
 import math
 import numpy
 
+from queue import Queue
+from threading import Thread
+
 
 def angle_to_radians(angle) -> float:
     """
@@ -40,4 +43,105 @@ def get_nearest_color(color_to_compare, palette:list):
         if distance < min_distance:
             min_distance = distance
             nearest_color = palette_color
-    return nearest_color
\ No newline at end of file
+    return nearest_color
+
+def rational_to_float(value) -> float | None:
+    """
+    Converts an ffmpeg rational (e.g. '30000/1001') into a float
+
+    :param value: Rational string, or a number
+    :return float: Value of the rational, None if it could not be converted or has a zero denominator
+    """
+    try:
+        numerator, _, denominator = str(value).partition('/')
+        denominator = float(denominator) if denominator else 1.0
+        return float(numerator) / denominator if denominator else None
+    except ValueError:
+        return None
+
+
+def convert_gray_to_rgb24(frames):
+    """
+    Converts gray frame(s) to rgb24, by repeating the gray channel
+
+    :param frames: A (height, width, 1) frame, or a (N, height, width, 1) stack of frames
+    :return: rgb24 frame(s)
+    """
+    return numpy.repeat(frames, 3, axis=-1)
+
+def convert_rgb24_to_gray(frames):
+    """
+    Converts rgb24 frame(s) to gray, via the ITU-R 601-2 luma transform (as Pillow's 'L' mode does)
+
+    :param frames: A (height, width, 3) frame, or a (N, height, width, 3) stack of frames
+    :return: gray frame(s), with a single component
+    """
+    luma = (frames[..., 0:1] * numpy.uint32(19595)
+            + frames[..., 1:2] * numpy.uint32(38470)
+            + frames[..., 2:3] * numpy.uint32(7471)
+            + numpy.uint32(0x8000)) >> 16
+    return luma.astype('uint8')
+
+def convert_rgb24_to_rgba(frames):
+    """
+    Converts rgb24 frame(s) to rgba, adding a fully opaque alpha channel
+
+    :param frames: A (height, width, 3) frame, or a (N, height, width, 3) stack of frames
+    :return: rgba frame(s)
+    """
+    rgba_frames = numpy.empty(frames.shape[:-1] + (4,), dtype='uint8')
+    rgba_frames[..., :3] = frames
+    rgba_frames[..., 3] = 255
+    return rgba_frames
+
+def convert_rgba_to_rgb24(frames):
+    """
+    Converts rgba frame(s) to rgb24, dropping the alpha channel
+
+    :param frames: A (height, width, 4) frame, or a (N, height, width, 4) stack of frames
+    :return: rgb24 frame(s)
+    """
+    return numpy.ascontiguousarray(frames[..., :3])
+
+def write_frames(stream, frames, queue_size:int=8):
+    """
+    Writes frames to a stream (e.g. ffmpeg's stdin) from a background thread, through a bounded queue.
+    The frames are produced in the calling thread while the earlier frames are being written,
+    and they are written via the buffer protocol, rather than copied with tobytes().
+
+    :param stream: Binary stream to write the frames to
+    :param frames: Iterable of uint8 frames
+    :param queue_size: Maximum number of frames waiting to be written
+    :raises OSError: When writing to the stream failed (e.g. ffmpeg exited)
+    """
+    frame_queue = Queue(maxsize=max(1, int(queue_size)))
+    errors = []
+
+    def write_queued_frames():
+        # Write each frame as it arrives, until we receive None
+        while (frame := frame_queue.get()) is not None:
+            # Keep draining the queue after an error, so the producer never blocks
+            if errors:
+                continue
+            try:
+                frame_data = memoryview(numpy.ascontiguousarray(frame)).cast('B')
+                while frame_data:
+                    frame_data = frame_data[stream.write(frame_data):]
+            except (OSError, ValueError) as e:
+                errors.append(e)
+
+    writer = Thread(target=write_queued_frames, name='write_frames', daemon=True)
+    writer.start()
+    try:
+        for frame in frames:
+            if errors:
+                break
+            frame_queue.put(frame)
+    finally:
+        # Let the writer finish the frames already queued
+        frame_queue.put(None)
+        writer.join()
+
+    # Let the caller know we were unable to write the frames
+    if errors:
+        raise errors[0]